@@ -1,14 +1,115 @@
-import json
-from flask import request, _request_ctx_stack
+from flask import request, _request_ctx_stack, g
 from functools import wraps
 from jose import jwt
-from urllib.request import urlopen
 import os
+import time
 
+from auth.jwks import JWKSKeyStore, url_fetcher, file_fetcher, \
+    static_fetcher
+from auth.token_cache import TokenCache
 
-AUTH0_DOMAIN = os.environ['AUTH0_DOMAIN']
-ALGORITHMS = os.environ['ALGORITHMS']
-API_AUDIENCE = os.environ['API_AUDIENCE']
+
+'''
+Settings are read from the environment on first use, not at import,
+so the package can be imported (and configured) without them
+
+    AUTH0_DOMAIN    the Auth0 tenant, gives issuer and JWKS URL
+    ALGORITHMS      accepted signing algorithms (default RS256)
+    API_AUDIENCE    expected audience of the tokens
+    AUTH0_ISSUER    issuer, https://AUTH0_DOMAIN/ by default
+    JWKS_URL        key set location, AUTH0_DOMAIN/.well-known/jwks.json
+                    by default
+    JWKS_FILE       read the key set from this file instead, no network
+
+configure() overrides any of them at runtime, i.e. with an in-memory
+key set for tests and benchmarks (see auth/testing.py)
+
+Issuer and audience are required, without them jose would skip the
+iss and aud checks and accept any token signed by a known key
+'''
+
+_settings = {}
+
+
+def get_settings():
+    if not _settings:
+        domain = os.environ.get('AUTH0_DOMAIN')
+        _settings.update({
+            'algorithms': os.environ.get('ALGORITHMS', 'RS256'),
+            'audience': os.environ.get('API_AUDIENCE'),
+            'issuer': os.environ.get('AUTH0_ISSUER') or (
+                'https://{}/'.format(domain) if domain else None)
+        })
+    return _settings
+
+
+def get_verification_settings():
+    '''
+    get_settings(), raises a RuntimeError if the issuer or audience
+    is neither in the environment nor set through configure()
+    '''
+    settings = get_settings()
+    if not settings['issuer']:
+        raise RuntimeError('no token issuer, set AUTH0_DOMAIN or '
+                           'AUTH0_ISSUER')
+    if not settings['audience']:
+        raise RuntimeError('no token audience, set API_AUDIENCE')
+    return settings
+
+
+def key_source_from_env():
+    if os.environ.get('JWKS_FILE'):
+        return file_fetcher(os.environ['JWKS_FILE'])
+    if os.environ.get('JWKS_URL'):
+        return url_fetcher(os.environ['JWKS_URL'])
+    if os.environ.get('AUTH0_DOMAIN'):
+        return url_fetcher('https://{}/.well-known/jwks.json'.format(
+            os.environ['AUTH0_DOMAIN']))
+    raise RuntimeError('no key source, set AUTH0_DOMAIN, JWKS_URL or '
+                       'JWKS_FILE')
+
+
+def _env_fetcher():
+    # resolved on the first refresh, then the store keeps that source
+    fetcher = key_source_from_env()
+    jwks_store.fetcher = fetcher
+    return fetcher()
+
+
+'''
+configure(issuer, audience, algorithms, jwks, jwks_file, jwks_url) method
+    overrides the settings from the environment, every argument is
+    optional. jwks (an in-memory key set), jwks_file and jwks_url select
+    the key source, the keys fetched so far and the tokens verified with
+    them are dropped
+'''
+
+
+def configure(issuer=None, audience=None, algorithms=None, jwks=None,
+              jwks_file=None, jwks_url=None):
+    settings = get_settings()
+    if issuer is not None:
+        settings['issuer'] = issuer
+    if audience is not None:
+        settings['audience'] = audience
+    if algorithms is not None:
+        settings['algorithms'] = algorithms
+
+    if jwks is not None:
+        jwks_store.use(static_fetcher(jwks))
+    elif jwks_file is not None:
+        jwks_store.use(file_fetcher(jwks_file))
+    elif jwks_url is not None:
+        jwks_store.use(url_fetcher(jwks_url))
+
+
+# Signing keys are cached in-process, see auth/jwks.py
+jwks_store = JWKSKeyStore(
+    _env_fetcher, ttl=int(os.environ.get('JWKS_TTL', 600)))
+
+# Verified payloads are reused until the token expires or its key rotates
+token_cache = TokenCache(maxsize=int(os.environ.get('TOKEN_CACHE_SIZE', 1024)))
+jwks_store.on_rotate(token_cache.evict_kids)
 
 # AuthError Exception
 
@@ -79,9 +180,12 @@ verify_decode_jwt(token) method
 
     it should be an Auth0 token with key id (kid)
     it should verify the token using Auth0 /.well-known/jwks.json
+        the key set is served from the in-process jwks_store, which
+        can also read a local file or an in-memory key set
     it should decode the payload from the token
     it should validate the claims
     return the decoded payload
+        tokens seen before are answered from token_cache
 
     !!NOTE urlopen has a common certificate error described here:
     https://stackoverflow.com/questions/50236117/scraping-ssl-certificate-verify-failed-error-for-http-en-wikipedia-org
@@ -89,35 +193,30 @@ verify_decode_jwt(token) method
 
 
 def verify_decode_jwt(token):
-    jsonurl = urlopen(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
-    jwks = json.loads(jsonurl.read())
+    payload = token_cache.get(token)
+    if payload is not None:
+        return payload
+
     unverified_header = jwt.get_unverified_header(token)
-    rsa_key = {}
     if 'kid' not in unverified_header:
         raise AuthError({
             'code': 'invalid_header',
             'description': 'Authorization malformed.'
         }, 401)
 
-    for key in jwks['keys']:
-        if key['kid'] == unverified_header['kid']:
-            rsa_key = {
-                'kty': key['kty'],
-                'kid': key['kid'],
-                'use': key['use'],
-                'n': key['n'],
-                'e': key['e']
-            }
+    settings = get_verification_settings()
+    rsa_key = jwks_store.get_key(unverified_header['kid'])
     if rsa_key:
         try:
             payload = jwt.decode(
                 token,
                 rsa_key,
-                algorithms=ALGORITHMS,
-                audience=API_AUDIENCE,
-                issuer='https://' + AUTH0_DOMAIN + '/'
+                algorithms=settings['algorithms'],
+                audience=settings['audience'],
+                issuer=settings['issuer']
             )
 
+            token_cache.put(token, payload, rsa_key['kid'])
             return payload
 
         except jwt.ExpiredSignatureError:
@@ -154,6 +253,7 @@ requires_auth(permission) decorator method
     check the requested permission
     return the decorator which passes the decoded payload
     to the decorated method
+    the time spent on these checks is added to g.auth_seconds
 '''
 
 
@@ -161,9 +261,14 @@ def requires_auth(permission=''):
     def requires_auth_decorator(f):
         @wraps(f)
         def wrapper(*args, **kwargs):
-            token = get_token_auth_header()
-            payload = verify_decode_jwt(token)
-            check_permissions(permission, payload)
+            start = time.perf_counter()
+            try:
+                token = get_token_auth_header()
+                payload = verify_decode_jwt(token)
+                check_permissions(permission, payload)
+            finally:
+                g.auth_seconds = g.get('auth_seconds', 0.0) + \
+                    time.perf_counter() - start
             return f(payload, *args, **kwargs)
 
         return wrapper
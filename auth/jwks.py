@@ -0,0 +1,204 @@
+import json
+import threading
+import time
+from urllib.request import urlopen
+
+
+'''
+url_fetcher(url) method
+    @INPUTS
+        url: location of a JSON Web Key Set (i.e. Auth0 /.well-known/jwks.json)
+
+    return a callable which downloads and parses the key set
+'''
+
+
+def url_fetcher(url, timeout=5):
+    def fetch():
+        with urlopen(url, timeout=timeout) as response:
+            return json.loads(response.read())
+    return fetch
+
+
+'''
+file_fetcher(path) method
+    @INPUTS
+        path: a JSON Web Key Set stored on disk, for air-gapped deployments
+
+    return a callable which reads the key set, so a replaced file is
+    picked up on the next refresh
+'''
+
+
+def file_fetcher(path):
+    def fetch():
+        with open(path) as file:
+            return json.load(file)
+    return fetch
+
+
+'''
+static_fetcher(jwks) method
+    @INPUTS
+        jwks: a JSON Web Key Set already in memory (i.e. from tests)
+
+    return a callable which hands out that key set
+'''
+
+
+def static_fetcher(jwks):
+    def fetch():
+        return jwks
+    return fetch
+
+
+'''
+parse_keys(jwks) method
+    @INPUTS
+        jwks: a parsed JSON Web Key Set
+
+    return {kid: key} for the RSA keys of the set, keys of another type
+    (EC, oct) or without a kid, modulus or exponent are skipped
+'''
+
+
+def parse_keys(jwks):
+    keys = {}
+    for key in jwks.get('keys', []):
+        if key.get('kty') != 'RSA' or not all(
+                key.get(field) for field in ('kid', 'n', 'e')):
+            continue
+        keys[key['kid']] = {
+            'kty': key['kty'],
+            'kid': key['kid'],
+            'use': key.get('use', 'sig'),
+            'n': key['n'],
+            'e': key['e']
+        }
+    return keys
+
+
+'''
+JWKSKeyStore
+    An in-process cache of signing keys keyed by their key id (kid).
+
+    - keys are kept for `ttl` seconds and refreshed in a background thread
+      once less than `refresh_ahead` seconds of their lifetime are left
+    - an unknown kid triggers a synchronous refetch, at most once every
+      `miss_interval` seconds, so forged kids cannot hammer the IdP
+    - if a refresh fails, or the key set cannot be parsed, the previously
+      fetched keys keep being served and the next attempt is delayed by
+      `miss_interval` seconds
+    - callbacks registered with on_rotate() receive the kids which were
+      dropped from the key set
+'''
+
+
+class JWKSKeyStore:
+    def __init__(self, fetcher, ttl=600, refresh_ahead=60, miss_interval=30,
+                 clock=time.monotonic):
+        self.fetcher = fetcher
+        self.ttl = ttl
+        self.refresh_ahead = refresh_ahead
+        self.miss_interval = miss_interval
+        self.clock = clock
+
+        self._keys = {}
+        self._fetched_at = None
+        self._last_miss_fetch = None
+        self._next_attempt = None
+        self._refreshing = False
+        self._rotation_listeners = []
+        self._lock = threading.Lock()
+
+    def on_rotate(self, listener):
+        self._rotation_listeners.append(listener)
+
+    def use(self, fetcher):
+        """
+        Switches to another key source. The cached keys are dropped and
+        reported to the rotation listeners, the new source is read on
+        the next lookup.
+        """
+        with self._lock:
+            removed = set(self._keys)
+            self.fetcher = fetcher
+            self._keys = {}
+            self._fetched_at = None
+            self._last_miss_fetch = None
+            self._next_attempt = None
+
+        if removed:
+            for listener in self._rotation_listeners:
+                listener(removed)
+
+    def get_key(self, kid):
+        """
+        Returns the RSA key for `kid` in the format expected by jose,
+        or None if the IdP does not know the kid.
+        """
+        now = self.clock()
+        fetched = False
+        if self._fetched_at is None:
+            if self._may_attempt(now):
+                fetched = self.refresh()
+        elif (now - self._fetched_at >= self.ttl - self.refresh_ahead and
+                self._may_attempt(now)):
+            self._refresh_in_background()
+
+        key = self._keys.get(kid)
+        if key is None and not fetched and self._may_refetch_on_miss():
+            self.refresh()
+            key = self._keys.get(kid)
+
+        return key
+
+    def refresh(self):
+        """
+        Fetches the key set synchronously. Returns True on success, on
+        failure the stale keys stay in place.
+        """
+        try:
+            keys = parse_keys(self.fetcher())
+        except Exception:
+            with self._lock:
+                self._next_attempt = self.clock() + self.miss_interval
+            return False
+
+        with self._lock:
+            removed = set(self._keys) - set(keys)
+            self._keys = keys
+            self._fetched_at = self.clock()
+            self._next_attempt = None
+
+        if removed:
+            for listener in self._rotation_listeners:
+                listener(removed)
+        return True
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self.refresh()
+            finally:
+                with self._lock:
+                    self._refreshing = False
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def _may_attempt(self, now):
+        return self._next_attempt is None or now >= self._next_attempt
+
+    def _may_refetch_on_miss(self):
+        now = self.clock()
+        with self._lock:
+            if (self._last_miss_fetch is not None and
+                    now - self._last_miss_fetch < self.miss_interval):
+                return False
+            self._last_miss_fetch = now
+        return True
@@ -0,0 +1,92 @@
+import base64
+import time
+
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import jwt
+
+from auth.auth import configure
+
+# permissions of the two Auth0 roles, the boss can do everything
+BOSS_PERMISSIONS = ['get:persons', 'get:objectives', 'get:requirements',
+                    'delete:objectives', 'delete:requirements',
+                    'patch:requirements', 'post:requirements',
+                    'post:objectives', 'get:reports', 'get:export',
+                    'get:metrics', 'profile:requests']
+EMPLOYEE_PERMISSIONS = ['get:persons', 'get:objectives', 'get:requirements',
+                        'patch:requirements']
+
+
+def _base64url_uint(value):
+    data = value.to_bytes((value.bit_length() + 7) // 8, 'big')
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+'''
+LocalKeyPair
+    A freshly generated RSA key which signs tokens the same way the
+    IdP does, so the whole RS256 verification path runs without network.
+
+    - jwks() returns the public key as a JSON Web Key Set, a drop-in
+      fetcher for auth.jwks.JWKSKeyStore
+    - mint(permissions) returns a signed token, issuer and audience
+      default to the ones given to the constructor
+'''
+
+
+class LocalKeyPair:
+    def __init__(self, kid='local-test-key', key_size=2048, issuer=None,
+                 audience=None):
+        self.kid = kid
+        self.issuer = issuer
+        self.audience = audience
+        self._key = rsa.generate_private_key(
+            public_exponent=65537, key_size=key_size,
+            backend=default_backend())
+        self.private_pem = self._key.private_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PrivateFormat.TraditionalOpenSSL,
+            encryption_algorithm=serialization.NoEncryption()
+        ).decode('ascii')
+
+    def jwks(self):
+        numbers = self._key.public_key().public_numbers()
+        return {'keys': [{
+            'kty': 'RSA',
+            'kid': self.kid,
+            'use': 'sig',
+            'alg': 'RS256',
+            'n': _base64url_uint(numbers.n),
+            'e': _base64url_uint(numbers.e)
+        }]}
+
+    def mint(self, permissions, issuer=None, audience=None, expires_in=3600,
+             subject='local|test', **claims):
+        now = int(time.time())
+        claims.update({
+            'iss': issuer or self.issuer,
+            'aud': audience or self.audience,
+            'sub': subject,
+            'iat': now,
+            'exp': now + expires_in,
+            'permissions': list(permissions)
+        })
+        return jwt.encode(claims, self.private_pem, algorithm='RS256',
+                          headers={'kid': self.kid})
+
+
+'''
+use_local_keys(issuer, audience) method
+    generates a LocalKeyPair and makes auth.auth verify against it
+    instead of Auth0, with the same RS256 checks as in production
+
+    return the key pair, i.e. use_local_keys().mint(['get:persons'])
+'''
+
+
+def use_local_keys(issuer='https://okr.local/', audience='okr'):
+    keys = LocalKeyPair(issuer=issuer, audience=audience)
+    configure(issuer=issuer, audience=audience, algorithms='RS256',
+              jwks=keys.jwks())
+    return keys
@@ -0,0 +1,76 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+'''
+TokenCache
+    A bounded LRU cache of verified JWT payloads.
+
+    - entries are keyed by the SHA-256 of the raw token, so the signature is
+      part of the key and a tampered token can never hit the cache
+    - an entry expires at the token's own `exp` claim
+    - entries signed by a key which disappeared from the JWKS are evicted
+      through evict_kids()
+'''
+
+
+class TokenCache:
+    def __init__(self, maxsize=1024, clock=time.time):
+        self.maxsize = maxsize
+        self.clock = clock
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(token):
+        return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+    def get(self, token):
+        """
+        Returns the cached payload of `token` or None on a miss.
+        """
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            payload, expires_at, kid = entry
+            if self.clock() >= expires_at:
+                del self._entries[key]
+                return None
+
+            self._entries.move_to_end(key)
+            return payload
+
+    def put(self, token, payload, kid):
+        if self.maxsize <= 0 or 'exp' not in payload:
+            return
+
+        key = self._key(token)
+        with self._lock:
+            self._entries[key] = (payload, payload['exp'], kid)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def evict_kids(self, kids):
+        """
+        Drops every entry verified with one of the key ids in `kids`.
+        """
+        kids = set(kids)
+        with self._lock:
+            stale = [key for key, (_, _, kid) in self._entries.items()
+                     if kid in kids]
+            for key in stale:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
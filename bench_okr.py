@@ -0,0 +1,270 @@
+"""
+Benchmarks every route of okr.create_app through the Flask test client
+against a scratch database filled with synthetic data, i.e.
+
+    python bench_okr.py --sizes 100,1000,10000 --save bench_baseline.json
+    python bench_okr.py --sizes 100,1000,10000 --compare bench_baseline.json
+
+Tokens are signed with a locally generated RSA key which auth.auth
+verifies against, so authentication runs in full without network.
+The tables of --database-url are dropped and recreated for every size,
+point it at a scratch database only (default: a temporary SQLite file)
+"""
+import argparse
+import json
+import math
+import os
+import sys
+import tempfile
+import time
+
+from auth.testing import use_local_keys, BOSS_PERMISSIONS, \
+    EMPLOYEE_PERMISSIONS
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--database-url', default=None,
+                        help='scratch database, a temporary SQLite file '
+                        'by default. ALL TABLES ARE DROPPED')
+    parser.add_argument('--sizes', default='100,1000',
+                        help='comma separated numbers of persons')
+    parser.add_argument('--requests', type=int, default=200,
+                        help='measured requests per route')
+    parser.add_argument('--warmup', type=int, default=5,
+                        help='unmeasured requests per route')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-cache', action='store_true',
+                        help='run with RESPONSE_CACHE_SIZE=0')
+    parser.add_argument('--save', default=None,
+                        help='write the results as JSON baseline')
+    parser.add_argument('--compare', default=None,
+                        help='baseline to check the results against')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed p50 slowdown against the baseline')
+    return parser.parse_args(argv)
+
+
+def percentile(samples, p):
+    """Nearest-rank percentile of a sorted list"""
+    rank = max(int(math.ceil(p / 100.0 * len(samples))), 1)
+    return samples[min(rank, len(samples)) - 1]
+
+
+def scenarios(counts, iterations):
+    """
+    Yields (name, role, method, request_fn, iterations) per route,
+    request_fn(i) returns (path, json body) for the i-th request.
+    Reads come first, destructive routes last so that every DELETE
+    hits an existing row
+    """
+    persons = counts['person']
+    objectives = counts['objective']
+    requirements = counts['requirement']
+    person_pages = max(persons // 5, 1)
+    objective_pages = max(objectives // 5, 1)
+
+    yield ('GET /persons', 'employee', 'GET',
+           lambda i: ('/persons?page={}'.format(i % person_pages + 1), None),
+           iterations)
+    yield ('GET /persons?per_page=100', 'employee', 'GET',
+           lambda i: ('/persons?per_page=100', None), iterations)
+    yield ('GET /objectives', 'employee', 'GET',
+           lambda i: ('/objectives?page={}'.format(
+               i % objective_pages + 1), None), iterations)
+    yield ('GET /objectives/<id>/requirements', 'employee', 'GET',
+           lambda i: ('/objectives/{}/requirements'.format(
+               i % objectives + 1), None), iterations)
+    yield ('GET /reports/progress', 'boss', 'GET',
+           lambda i: ('/reports/progress', None), iterations)
+    yield ('GET /reports/progress?person', 'boss', 'GET',
+           lambda i: ('/reports/progress?person={}'.format(
+               i % persons + 1), None), iterations)
+    yield ('GET /export', 'boss', 'GET',
+           lambda i: ('/export', None), max(iterations // 20, 1))
+    yield ('PATCH /requirements/<id>', 'employee', 'PATCH',
+           lambda i: ('/requirements/{}'.format(i % requirements + 1), {
+               'requirement_id': i % requirements + 1,
+               'objective_id': None,
+               'is_met': i % 2 == 0}),
+           iterations)
+    yield ('POST /objectives/<id>/requirements', 'boss', 'POST',
+           lambda i: ('/objectives/{}/requirements'.format(
+               i % objectives + 1),
+               [{'description': 'Benchmark step {}'.format(n)}
+                for n in range(5)]), iterations)
+    yield ('POST /objectives', 'boss', 'POST',
+           lambda i: ('/objectives', {
+               'objective': 'Benchmark objective',
+               'person': i % persons + 1,
+               'requirements': ['First step', 'Second step']}),
+           iterations)
+    yield ('DELETE /requirements/<id>', 'boss', 'DELETE',
+           lambda i: ('/requirements/{}'.format(requirements - i), None),
+           min(iterations, requirements // 2))
+    yield ('DELETE /objectives/<id>', 'boss', 'DELETE',
+           lambda i: ('/objectives/{}'.format(i + 1), None),
+           min(iterations, objectives // 2))
+
+
+def run_scenario(client, engine, headers, method, request_fn, warmup,
+                 iterations, objective_of):
+    from okr.testing import QueryCounter
+
+    latencies = []
+    queries = 0
+    errors = 0
+    for i in range(warmup + iterations):
+        path, body = request_fn(i)
+        if method == 'PATCH':
+            body['objective_id'] = objective_of(body['requirement_id'])
+
+        with QueryCounter(engine) as counter:
+            start = time.perf_counter()
+            response = client.open(path, method=method, headers=headers,
+                                   json=body)
+            response.get_data()
+            elapsed = time.perf_counter() - start
+
+        if i < warmup:
+            continue
+        latencies.append(elapsed)
+        queries += counter.count
+        if response.status_code >= 400:
+            errors += 1
+
+    if not latencies:
+        return None
+
+    latencies.sort()
+    total = sum(latencies)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput': round(len(latencies) / total, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'queries_per_request': round(queries / len(latencies), 2)
+    }
+
+
+def run_size(persons, args, headers):
+    from models import db, Requirement
+    from okr import create_app
+    from okr.bulk_load import BulkLoader
+    from okr.synthetic import generate_records
+
+    test_config = {}
+    if args.no_cache:
+        test_config['RESPONSE_CACHE_SIZE'] = 0
+    app = create_app(test_config)
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        counts = BulkLoader().load(generate_records(persons, seed=args.seed))
+        engine = db.engine
+
+    # PATCH needs the owning objective of each requirement
+    owners = {}
+
+    def objective_of(requirement_id):
+        if requirement_id not in owners:
+            with app.app_context():
+                owners[requirement_id] = db.session.query(
+                    Requirement.objective).filter(
+                        Requirement.id == requirement_id).scalar()
+        return owners[requirement_id]
+
+    results = {}
+    client = app.test_client()
+    for name, role, method, request_fn, iterations in scenarios(
+            counts, args.requests):
+        results[name] = run_scenario(client, engine, headers[role], method,
+                                     request_fn, args.warmup, iterations,
+                                     objective_of)
+    return counts, results
+
+
+def compare(results, baseline, tolerance):
+    """Returns a line per route which got slower or issues more queries"""
+    regressions = []
+    for size, routes in results.items():
+        for name, result in routes.items():
+            base = baseline.get(size, {}).get(name)
+            if result is None or base is None:
+                continue
+            if result['p50_ms'] > base['p50_ms'] * (1 + tolerance):
+                regressions.append('{} persons, {}: p50 {} ms, baseline {} ms'
+                                   .format(size, name, result['p50_ms'],
+                                           base['p50_ms']))
+            if result['queries_per_request'] > base['queries_per_request']:
+                regressions.append('{} persons, {}: {} queries per request, '
+                                   'baseline {}'.format(
+                                       size, name,
+                                       result['queries_per_request'],
+                                       base['queries_per_request']))
+    return regressions
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    sizes = [int(size) for size in args.sizes.split(',')]
+
+    database_url = args.database_url
+    if database_url is None:
+        scratch = tempfile.mkdtemp(prefix='okr-bench-')
+        database_url = 'sqlite:///' + os.path.join(scratch, 'bench.db')
+
+    # models reads its settings at import time
+    os.environ['DATABASE_URL'] = database_url
+
+    keys = use_local_keys()
+    headers = {
+        role: {'Authorization': 'Bearer ' + keys.mint(permissions)}
+        for role, permissions in (('boss', BOSS_PERMISSIONS),
+                                  ('employee', EMPLOYEE_PERMISSIONS))}
+
+    results = {}
+    for persons in sizes:
+        counts, results[str(persons)] = run_size(persons, args, headers)
+        print('\n{person} persons, {objective} objectives, '
+              '{requirement} requirements'.format(**counts))
+        print('{:<38} {:>9} {:>9} {:>9} {:>8} {:>6}'.format(
+            'route', 'req/s', 'p50 ms', 'p99 ms', 'queries', 'errors'))
+        for name, result in results[str(persons)].items():
+            if result is None:
+                continue
+            print('{:<38} {throughput:>9} {p50_ms:>9} {p99_ms:>9} '
+                  '{queries_per_request:>8} {errors:>6}'.format(
+                      name, **result))
+
+    if args.save:
+        with open(args.save, 'w') as file:
+            json.dump({
+                'dialect': database_url.split(':')[0],
+                'cache': not args.no_cache,
+                'requests': args.requests,
+                'results': results
+            }, file, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        if (baseline['dialect'], baseline['cache']) != (
+                database_url.split(':')[0], not args.no_cache):
+            print('\n{} was recorded on {} with cache {}, not comparable'
+                  .format(args.compare, baseline['dialect'],
+                          'on' if baseline['cache'] else 'off'))
+            return 2
+        regressions = compare(results, baseline['results'], args.tolerance)
+        if regressions:
+            print('\nRegressions against {}:'.format(args.compare))
+            print('\n'.join(regressions))
+            return 1
+        print('\nNo regressions against {}'.format(args.compare))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
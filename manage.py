@@ -3,8 +3,11 @@ from flask_migrate import Migrate, MigrateCommand
 
 from app import app
 from models import db
+from okr.bulk_load import BulkLoader, read_records
+from okr.synthetic import generate_records, parse_range
 
 import os
+import time
 
 migrate = Migrate(app, db)
 manager = Manager(app)
@@ -12,5 +15,52 @@ manager = Manager(app)
 manager.add_command('db', MigrateCommand)
 
 
+@manager.option('path', help='NDJSON or CSV file as written by GET /export')
+@manager.option('-f', '--format', dest='file_format', default=None,
+                help='ndjson or csv, guessed from the extension by default')
+def import_data(path, file_format=None):
+    """
+    Bulk-loads persons, objectives and requirements from an export file
+    with COPY (PostgreSQL) or batched inserts, in one transaction.
+    All rows get new ids, the references between them are kept
+    """
+    start = time.perf_counter()
+    counts = BulkLoader().load(read_records(path, file_format))
+    print('Loaded {person} persons, {objective} objectives and '
+          '{requirement} requirements in {seconds:.1f}s'.format(
+              seconds=time.perf_counter() - start, **counts))
+
+
+
+@manager.option('-p', '--persons', dest='persons', type=int, default=1000)
+@manager.option('-o', '--objectives', dest='objectives', default='1-5',
+                help='objectives per person, a number or a range like 1-5')
+@manager.option('-r', '--requirements', dest='requirements',
+                default='1-10', help='requirements per objective, '
+                'a number or a range like 1-10')
+@manager.option('-m', '--met-ratio', dest='met_ratio', type=float,
+                default=0.3, help='share of met requirements')
+@manager.option('-b', '--boss-ratio', dest='boss_ratio', type=float,
+                default=0.1, help='share of bosses among the persons')
+@manager.option('-s', '--seed', dest='seed', type=int, default=0)
+def generate_data(persons, objectives, requirements, met_ratio,
+                  boss_ratio, seed):
+    """
+    Bulk-loads a synthetic organisation for load testing, i.e.
+    python manage.py generate_data -p 1000000 -o 2-8 -r 1-9
+    for about 5M objectives and 25M requirements. The same seed gives
+    the same data
+    """
+    start = time.perf_counter()
+    records = generate_records(
+        persons, objectives_per_person=parse_range(objectives),
+        requirements_per_objective=parse_range(requirements),
+        met_ratio=met_ratio, boss_ratio=boss_ratio, seed=seed)
+    counts = BulkLoader().load(records)
+    print('Generated {person} persons, {objective} objectives and '
+          '{requirement} requirements in {seconds:.1f}s'.format(
+              seconds=time.perf_counter() - start, **counts))
+
+
 if __name__ == '__main__':
     manager.run()
\ No newline at end of file
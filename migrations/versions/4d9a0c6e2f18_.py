@@ -0,0 +1,38 @@
+"""add requirement progress counters to objectives
+
+Revision ID: 4d9a0c6e2f18
+Revises: b7e4d2a91c3f
+Create Date: 2026-10-18 11:05:47.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4d9a0c6e2f18'
+down_revision = 'b7e4d2a91c3f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('objectives', sa.Column('requirements_total', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('objectives', sa.Column('requirements_met', sa.Integer(), server_default='0', nullable=False))
+
+    # backfill the counters of the existing objectives
+    op.execute("""
+        UPDATE objectives SET
+            requirements_total = (
+                SELECT count(*) FROM requirements
+                WHERE requirements.objective = objectives.id),
+            requirements_met = (
+                SELECT count(*) FROM requirements
+                WHERE requirements.objective = objectives.id
+                AND requirements.is_met)
+    """)
+
+
+def downgrade():
+    op.drop_column('objectives', 'requirements_met')
+    op.drop_column('objectives', 'requirements_total')
@@ -0,0 +1,27 @@
+"""add indexes on foreign keys
+
+Revision ID: b7e4d2a91c3f
+Revises: 61f12a9cddf8
+Create Date: 2026-10-18 10:12:31.402113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e4d2a91c3f'
+down_revision = '61f12a9cddf8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(op.f('ix_objectives_person'), 'objectives', ['person'], unique=False)
+    # leading column `objective` also covers plain FK lookups and cascades
+    op.create_index('ix_requirements_objective_id', 'requirements', ['objective', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_requirements_objective_id', table_name='requirements')
+    op.drop_index(op.f('ix_objectives_person'), table_name='objectives')
@@ -0,0 +1,34 @@
+"""add data versions
+
+Revision ID: e2c81f5b7a09
+Revises: 4d9a0c6e2f18
+Create Date: 2026-10-18 12:21:09.530772
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2c81f5b7a09'
+down_revision = '4d9a0c6e2f18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    data_versions = op.create_table('data_versions',
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('version', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+    op.bulk_insert(data_versions, [
+        {'name': 'persons', 'version': 0},
+        {'name': 'objectives', 'version': 0},
+    ])
+    op.add_column('objectives', sa.Column('version', sa.BigInteger(), server_default='0', nullable=False))
+
+
+def downgrade():
+    op.drop_column('objectives', 'version')
+    op.drop_table('data_versions')
@@ -1,8 +1,21 @@
 import os
 import json
-
-from sqlalchemy import Column, String, Integer, Boolean 
-from flask_sqlalchemy import SQLAlchemy
+import sqlite3
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from sqlalchemy import Column, String, Integer, BigInteger, Boolean, select, \
+    event
+from sqlalchemy import create_engine, orm
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.sql.expression import UpdateBase
+from flask import g, has_app_context
+from sqlalchemy.orm.attributes import get_history
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
 from flask_migrate import Migrate
 
 # database_name = 'okr_test_local'
@@ -10,22 +23,293 @@ from flask_migrate import Migrate
 
 database_path = os.environ['DATABASE_URL']
 
-db = SQLAlchemy()
+# read replicas, comma separated, see ReplicaSet
+replica_paths = [path for path in
+                 os.environ.get('DATABASE_REPLICA_URLS', '').split(',')
+                 if path]
+
+# seconds between health checks of a replica, and how long a failed
+# replica is skipped
+REPLICA_CHECK_INTERVAL = 5
+# seconds a replica gets to accept a connection, the health check runs
+# on the request path and must not hang on an unreachable host
+REPLICA_CONNECT_TIMEOUT = 2
+
+logger = logging.getLogger('okr.models')
+
+
+'''
+RoutingSession
+    sends the statements of a request to the replica engine in
+    g.db_replica, if one was chosen for it. Flushes and INSERT, UPDATE
+    or DELETE statements always go to the primary
+'''
+
+
+class RoutingSession(SignallingSession):
+    def get_bind(self, mapper=None, clause=None):
+        replica = g.get('db_replica') if has_app_context() else None
+        if replica is not None and not self._flushing and \
+                not isinstance(clause, UpdateBase):
+            return replica
+        return super().get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+db = RoutingSQLAlchemy()
+
+# rows per multi-row INSERT, keeps the statement below the bind limits
+INSERT_BATCH_SIZE = 1000
+
+# connection pool defaults, overridden by the DB_* environment variables
+POOL_SIZE = 5
+MAX_OVERFLOW = 10
+POOL_TIMEOUT = 30
+POOL_RECYCLE = 1800
+
+
+'''
+TimedQueuePool
+    the default QueuePool, which also counts how long checkouts wait
+    for a free connection and how often they time out. checkedout(),
+    overflow() and size() come from QueuePool
+'''
+
+
+class TimedQueuePool(QueuePool):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.timeouts = 0
+        self._stats_lock = threading.Lock()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            with self._stats_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            with self._stats_lock:
+                self.waits += 1
+                self.wait_seconds += time.perf_counter() - start
+
+
+'''
+engine_options(database_uri)
+    returns the SQLALCHEMY_ENGINE_OPTIONS for the uri, read from
+
+        DB_POOL_SIZE          connections kept open per worker (5)
+        DB_MAX_OVERFLOW       extra connections under load (10)
+        DB_POOL_TIMEOUT       seconds to wait for a connection (30)
+        DB_POOL_RECYCLE       seconds before a connection is replaced (1800)
+        DB_POOL_PRE_PING      test connections on checkout (true)
+        DB_STATEMENT_TIMEOUT  milliseconds per statement, PostgreSQL only
+                              (0, no limit)
+
+    SQLite keeps the pool SQLAlchemy picks for it
+'''
+
+
+def engine_options(database_uri, environ=os.environ):
+    if database_uri.startswith('sqlite'):
+        return {}
+
+    options = {
+        'poolclass': TimedQueuePool,
+        'pool_size': int(environ.get('DB_POOL_SIZE', POOL_SIZE)),
+        'max_overflow': int(environ.get('DB_MAX_OVERFLOW', MAX_OVERFLOW)),
+        'pool_timeout': float(environ.get('DB_POOL_TIMEOUT', POOL_TIMEOUT)),
+        'pool_recycle': int(environ.get('DB_POOL_RECYCLE', POOL_RECYCLE)),
+        'pool_pre_ping': environ.get('DB_POOL_PRE_PING', 'true').lower()
+        in ('1', 'true', 'yes')
+    }
+
+    statement_timeout = int(environ.get('DB_STATEMENT_TIMEOUT', 0))
+    if statement_timeout and database_uri.startswith('postgres'):
+        options['connect_args'] = {
+            'options': '-c statement_timeout={}'.format(statement_timeout)}
+    return options
+
+
+'''
+replica_engine_options(database_uri)
+    engine_options() of a replica, plus a connect timeout read from
+
+        DB_REPLICA_CONNECT_TIMEOUT  seconds to open a connection (2),
+                                    PostgreSQL only
+'''
+
+
+def replica_engine_options(database_uri, environ=os.environ):
+    options = engine_options(database_uri, environ)
+    if database_uri.startswith('postgres'):
+        connect_args = dict(options.get('connect_args', {}))
+        connect_args['connect_timeout'] = int(environ.get(
+            'DB_REPLICA_CONNECT_TIMEOUT', REPLICA_CONNECT_TIMEOUT))
+        options['connect_args'] = connect_args
+    return options
+
+
+'''
+ReplicaSet
+    engines for the read replicas, created on first use with the same
+    pool settings as the primary and a short connect timeout
+
+    choose() returns the next healthy replica (round robin) or None,
+    then the primary serves the request. A replica is checked with
+    SELECT 1 at most every `check_interval` seconds, one which fails is
+    skipped for `check_interval` seconds
+'''
+
+
+class ReplicaSet:
+    def __init__(self, paths, check_interval=REPLICA_CHECK_INTERVAL,
+                 clock=time.monotonic):
+        self.paths = list(paths)
+        self.check_interval = check_interval
+        self.clock = clock
+
+        self._engines = {}
+        self._checked_at = {}
+        self._down_until = {}
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.paths)
+
+    def engine(self, path):
+        with self._lock:
+            engine = self._engines.get(path)
+            if engine is None:
+                engine = self._engines[path] = create_engine(
+                    path, **replica_engine_options(path))
+        return engine
+
+    def choose(self):
+        for _ in range(len(self.paths)):
+            with self._lock:
+                path = self.paths[self._next % len(self.paths)]
+                self._next += 1
+            if self.is_healthy(path):
+                return self.engine(path)
+        return None
+
+    def is_healthy(self, path):
+        now = self.clock()
+        if now < self._down_until.get(path, now):
+            return False
+        checked_at = self._checked_at.get(path)
+        if checked_at is not None and now - checked_at < self.check_interval:
+            return True
+
+        try:
+            with self.engine(path).connect() as connection:
+                connection.execute(select([1])).scalar()
+        except Exception:
+            logger.warning('replica %s is down, using the primary',
+                           path.rsplit('@', 1)[-1])
+            self._down_until[path] = now + self.check_interval
+            return False
+
+        self._checked_at[path] = now
+        return True
+
+    def dispose(self):
+        for engine in self._engines.values():
+            engine.dispose()
+
 
 '''
 setup_db(app)
     binds a flask application and a SQLAlchemy service
+    pool settings come from engine_options() unless the app config
+    already has SQLALCHEMY_ENGINE_OPTIONS, read replicas from
+    SQLALCHEMY_REPLICA_URIS (DATABASE_REPLICA_URLS by default)
 '''
 
 def setup_db(app, database_path=database_path):
     app.config['SQLALCHEMY_DATABASE_URI'] = database_path
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS',
+                          engine_options(database_path))
+    app.config.setdefault('SQLALCHEMY_REPLICA_URIS', replica_paths)
+    app.extensions['replicas'] = ReplicaSet(
+        app.config['SQLALCHEMY_REPLICA_URIS'])
     db.app = app
     db.init_app(app)
     # db.create_all()
     migrate = Migrate(app, db)
 
 
+'''
+unit_of_work()
+    groups several insert(), update() and delete() calls into one
+    transaction: inside the block they only flush (so generated ids
+    are available), the block commits once at the end and rolls back
+    if it raises. Blocks can be nested, only the outermost commits
+
+    with unit_of_work():
+        objective.insert()
+        requirement.insert()
+'''
+
+
+@contextmanager
+def unit_of_work():
+    session = db.session()
+    depth = session.info.get('unit_of_work', 0)
+    session.info['unit_of_work'] = depth + 1
+    try:
+        yield session
+        if depth == 0:
+            session.commit()
+    except Exception:
+        if depth == 0:
+            session.rollback()
+        raise
+    finally:
+        session.info['unit_of_work'] = depth
+
+
+def save():
+    '''
+    commits the session, or only flushes it inside a unit_of_work()
+    '''
+    session = db.session()
+    if session.info.get('unit_of_work'):
+        session.flush()
+    else:
+        session.commit()
+
+
+@event.listens_for(Engine, 'connect')
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    '''
+    SQLite only honours ON DELETE CASCADE with foreign keys enabled
+    '''
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
+
+
+def supports_returning():
+    '''
+    True if the database returns generated ids from a multi-row
+    INSERT ... RETURNING (PostgreSQL)
+    '''
+    return db.session.get_bind().dialect.name == 'postgresql'
+
+
 '''
 Person
 '''
@@ -38,7 +322,9 @@ class Person(db.Model):
     first_name = Column(String, nullable = False)
     is_boss = Column(Boolean, nullable = False)
 
-    objectives = db.relationship('Objective', backref = 'person_ref', lazy = True, cascade = 'all, delete-orphan')
+    # passive_deletes: the ON DELETE CASCADE in the database removes
+    # the children, they are never loaded just to be deleted
+    objectives = db.relationship('Objective', backref = 'person_ref', lazy = True, cascade = 'all, delete-orphan', passive_deletes = True)
 
     def __init__(self, name, first_name, is_boss=False):
         self.name = name
@@ -47,14 +333,14 @@ class Person(db.Model):
     
     def insert(self):
         db.session.add(self)
-        db.session.commit()
+        save()
 
     def update(self):
-        db.session.commit()
+        save()
 
     def delete(self):
         db.session.delete(self)
-        db.session.commit()
+        save()
 
     def format(self):
         return {
@@ -75,9 +361,16 @@ class Objective(db.Model):
 
     id = Column(Integer, primary_key=True)
     description = Column(String, nullable = False)
-    person = db.Column(Integer, db.ForeignKey('persons.id', ondelete="CASCADE"), nullable = False)
+    person = db.Column(Integer, db.ForeignKey('persons.id', ondelete="CASCADE"), nullable = False, index = True)
+    # progress counters, maintained by adjust_progress() in the same
+    # transaction as every requirement insert, delete and status change
+    requirements_total = Column(Integer, nullable = False, default = 0, server_default = '0')
+    requirements_met = Column(Integer, nullable = False, default = 0, server_default = '0')
+    # bumped with the counters on every requirement change and on
+    # every ORM change of the objective itself
+    version = Column(BigInteger, nullable = False, default = 0, server_default = '0')
 
-    requirements = db.relationship('Requirement', backref = 'objectives_ref', lazy = True, cascade = 'all, delete-orphan')
+    requirements = db.relationship('Requirement', backref = 'objectives_ref', lazy = True, cascade = 'all, delete-orphan', passive_deletes = True)
 
     @property
     def get_name(self):
@@ -89,14 +382,39 @@ class Objective(db.Model):
 
     def insert(self):
         db.session.add(self)
-        db.session.commit()
+        save()
+
+    def insert_with_requirements(self, descriptions):
+        '''
+        inserts the objective and a requirement per description
+        with one commit, returns the ids of the requirements
+        '''
+        db.session.add(self)
+        db.session.flush()
+        ids = Requirement.insert_rows(self.id, descriptions)
+        save()
+        return ids
 
     def update(self):
-        db.session.commit()
+        save()
 
     def delete(self):
         db.session.delete(self)
-        db.session.commit()
+        save()
+
+    @classmethod
+    def delete_by_id(cls, objective_id):
+        '''
+        deletes the objective with one DELETE statement, the database
+        cascades to its requirements
+        returns False if there was no such objective
+        '''
+        deleted = cls.query.filter(cls.id == objective_id).delete(
+            synchronize_session=False)
+        if deleted:
+            bump_versions('objectives')
+        save()
+        return deleted == 1
 
     def format(self):
         return {
@@ -104,6 +422,8 @@ class Objective(db.Model):
             'description': self.description,
             'person': self.person,
             'complete_name': self.get_name,
+            'requirements_total': self.requirements_total,
+            'requirements_met': self.requirements_met,
         }
 
 
@@ -113,6 +433,11 @@ Requirements
 
 class Requirement(db.Model):
     __tablename__ = 'requirements'
+    # serves the FK lookups / cascades on `objective` as well as the
+    # per-objective listing ordered by id as one index range scan
+    __table_args__ = (
+        db.Index('ix_requirements_objective_id', 'objective', 'id'),
+    )
 
     id = Column(Integer, primary_key=True)
     description = Column(String, nullable = False)
@@ -126,14 +451,109 @@ class Requirement(db.Model):
 
     def insert(self):
         db.session.add(self)
-        db.session.commit()
+        save()
 
     def update(self):
-        db.session.commit()
+        save()
 
     def delete(self):
         db.session.delete(self)
-        db.session.commit()
+        save()
+
+    @classmethod
+    def bulk_insert(cls, objective, descriptions):
+        '''
+        inserts one requirement per description with multi-row
+        INSERT ... RETURNING and commits once
+        returns the new ids in the order of the descriptions
+        '''
+        ids = cls.insert_rows(objective, descriptions)
+        save()
+        return ids
+
+    @classmethod
+    def insert_rows(cls, objective, descriptions):
+        '''
+        like bulk_insert but leaves the commit to the caller
+        '''
+        lock_objectives([objective])
+        if not supports_returning():
+            requirements = [cls(description, objective)
+                            for description in descriptions]
+            db.session.add_all(requirements)
+            db.session.flush()
+            return [requirement.id for requirement in requirements]
+
+        table = cls.__table__
+        ids = []
+        for start in range(0, len(descriptions), INSERT_BATCH_SIZE):
+            rows = [{'description': description,
+                     'is_met': False,
+                     'objective': objective}
+                    for description in
+                    descriptions[start:start + INSERT_BATCH_SIZE]]
+            result = db.session.execute(
+                table.insert().values(rows).returning(table.c.id))
+            # ids of one statement are drawn from the sequence in row order
+            ids.extend(sorted(row[0] for row in result))
+
+        adjust_progress(objective, total=len(ids))
+        bump_versions('objectives')
+        return ids
+
+    @classmethod
+    def set_status(cls, requirement_id, objective, is_met):
+        '''
+        sets is_met and reads the previous status in one statement, so
+        concurrent toggles are atomic. On PostgreSQL an UPDATE ... FROM
+        a locked subquery RETURNING the old value, elsewhere a
+        conditional UPDATE which only matches if the status changes,
+        SQLite holds the write lock from that UPDATE on
+        returns (previous_status, changed), None if the requirement
+        does not exist, raises ValueError if it belongs to another
+        objective
+        '''
+        lock_objectives([objective])
+        table = cls.__table__
+        if supports_returning():
+            old = select([table.c.id, table.c.is_met]) \
+                .where(table.c.id == requirement_id) \
+                .with_for_update().alias('old')
+            previous = db.session.execute(
+                table.update()
+                .where(table.c.id == old.c.id)
+                .where(table.c.objective == objective)
+                .values(is_met=is_met)
+                .returning(old.c.is_met)).scalar()
+            changed = previous is not None and previous != is_met
+        else:
+            result = db.session.execute(
+                table.update()
+                .where(table.c.id == requirement_id)
+                .where(table.c.objective == objective)
+                .where(table.c.is_met != is_met)
+                .values(is_met=is_met))
+            changed = result.rowcount == 1
+            previous = not is_met if changed else None
+
+        if changed:
+            adjust_progress(objective, met=1 if is_met else -1)
+            bump_versions('objectives')
+            save()
+            return previous, True
+        if previous is not None:
+            return previous, False
+
+        # no row matched, only now find out why
+        row = db.session.execute(
+            select([table.c.is_met, table.c.objective])
+            .where(table.c.id == requirement_id)).first()
+
+        if row is None:
+            return None
+        if row.objective != objective:
+            raise ValueError('requirement belongs to another objective')
+        return row.is_met, False
 
     def format(self):
         return {
@@ -142,4 +562,234 @@ class Requirement(db.Model):
             'description': self.description,
             'objective_id': self.objective,
             'objective_description': self.objectives_ref.description,
-        }
\ No newline at end of file
+        }
+
+
+'''
+DataVersion
+    a monotonically increasing version per table, bumped in the same
+    transaction as every change to it. Together with objectives.version
+    caches can check whether data changed with one primary key lookup.
+    Every write locks the objective rows it touches before the
+    requirement rows and before these rows, so concurrent writers
+    cannot deadlock on them
+'''
+
+class DataVersion(db.Model):
+    __tablename__ = 'data_versions'
+
+    name = Column(String, primary_key=True)
+    version = Column(BigInteger, nullable = False, default = 0)
+
+
+def bump_versions(*names, session=None):
+    '''
+    increments the versions of the given tables
+    '''
+    session = session or db.session
+    table = DataVersion.__table__
+    result = session.execute(
+        table.update()
+        .where(table.c.name.in_(names))
+        .values(version=table.c.version + 1))
+
+    if result.rowcount < len(set(names)):
+        # first change of a table in a database created without the
+        # migration, which seeds the rows
+        existing = {row.name for row in session.execute(
+            select([table.c.name]).where(table.c.name.in_(names)))}
+        for name in set(names) - existing:
+            session.execute(table.insert().values(name=name, version=1))
+
+
+def current_versions(names):
+    '''
+    returns {name: version} for table names like 'objectives' and for
+    'requirements:<objective id>', the version of one objective's
+    requirements, with one primary key lookup per kind
+    '''
+    versions = {}
+    tables = [name for name in names if ':' not in name]
+    objectives = {int(name.split(':')[1]): name
+                  for name in names if name.startswith('requirements:')}
+
+    if tables:
+        table = DataVersion.__table__
+        found = dict(db.session.execute(
+            select([table.c.name, table.c.version])
+            .where(table.c.name.in_(tables))).fetchall())
+        for name in tables:
+            versions[name] = found.get(name, 0)
+
+    if objectives:
+        table = Objective.__table__
+        found = dict(db.session.execute(
+            select([table.c.id, table.c.version])
+            .where(table.c.id.in_(list(objectives)))).fetchall())
+        for objective, name in objectives.items():
+            versions[name] = found.get(objective)
+
+    return versions
+
+
+# cached listings whose content changes when a row of a model is
+# added/deleted. Requirements are listed per objective and covered by
+# objectives.version, their counters show up in the objectives listing
+CHANGED_BY_INSERT = {
+    'Person': ('persons',),
+    'Objective': ('objectives',),
+    'Requirement': ('objectives',),
+}
+CHANGED_BY_DELETE = {
+    'Person': ('persons', 'objectives'),
+    'Objective': ('objectives',),
+    'Requirement': ('objectives',),
+}
+
+
+def bump_flushed_versions(session):
+    '''
+    bumps the versions of all tables touched by an ORM flush, called
+    by track_flushed_changes() after the objective rows are updated
+    '''
+    names = set()
+    for instance in session.new:
+        names.update(CHANGED_BY_INSERT.get(type(instance).__name__, ()))
+    for instance in session.deleted:
+        names.update(CHANGED_BY_DELETE.get(type(instance).__name__, ()))
+    for instance in session.dirty:
+        if session.is_modified(instance):
+            names.update(CHANGED_BY_INSERT.get(type(instance).__name__, ()))
+
+    if names:
+        bump_versions(*sorted(names), session=session)
+
+
+def touch_objectives(objectives, session):
+    '''
+    bumps the version of objectives changed through the ORM, i.e. a
+    new description, so their cached requirement lists are refreshed
+    '''
+    table = Objective.__table__
+    session.execute(
+        table.update()
+        .where(table.c.id.in_(sorted(objectives)))
+        .values(version=table.c.version + 1))
+
+
+'''
+Progress counters
+'''
+
+
+def lock_objectives(objectives, session=None):
+    '''
+    locks the rows of the given objectives (FOR NO KEY UPDATE on
+    PostgreSQL) before their requirements are written. Deleting an
+    objective locks its row before the cascade reaches the requirements,
+    requirement writes take the locks in the same order so the two
+    cannot deadlock
+    '''
+    objectives = sorted({objective for objective in objectives
+                         if objective is not None})
+    if not objectives:
+        return
+
+    table = Objective.__table__
+    (session or db.session).execute(
+        select([table.c.id])
+        .where(table.c.id.in_(objectives))
+        .with_for_update(key_share=True))
+
+
+def adjust_progress(objective, total=0, met=0, session=None):
+    '''
+    shifts the requirement counters of one objective and bumps its
+    version, within the current transaction
+    '''
+    if not total and not met:
+        return
+
+    table = Objective.__table__
+    (session or db.session).execute(
+        table.update()
+        .where(table.c.id == objective)
+        .values(requirements_total=table.c.requirements_total + total,
+                requirements_met=table.c.requirements_met + met,
+                version=table.c.version + 1))
+
+
+@event.listens_for(SignallingSession, 'before_flush')
+def lock_flushed_objectives(session, flush_context, instances):
+    '''
+    before each flush: locks the objectives of the requirements about
+    to be added, deleted or changed, ahead of the requirement rows
+    '''
+    objectives = set()
+    for requirement in session.new | session.deleted:
+        if isinstance(requirement, Requirement):
+            objectives.add(requirement.objective)
+
+    for requirement in session.dirty:
+        if isinstance(requirement, Requirement) and \
+                session.is_modified(requirement):
+            objectives.add(requirement.objective)
+            objectives.update(get_history(requirement, 'objective').deleted)
+
+    lock_objectives(objectives, session=session)
+
+
+@event.listens_for(SignallingSession, 'after_flush')
+def track_flushed_changes(session, flush_context):
+    '''
+    after each flush: requirements added, deleted or changed through
+    the ORM update the counters of their objectives with one UPDATE per
+    touched objective, objectives changed through the ORM, or with a
+    requirement edited through it, get a new version, then the table versions are bumped. Objective rows are
+    always locked before the data_versions rows
+    '''
+    deltas = {}
+
+    def add(objective, total, met):
+        current = deltas.get(objective, (0, 0))
+        deltas[objective] = (current[0] + total, current[1] + met)
+
+    for requirement in session.new:
+        if isinstance(requirement, Requirement):
+            add(requirement.objective, 1, int(requirement.is_met))
+
+    for requirement in session.deleted:
+        if isinstance(requirement, Requirement):
+            add(requirement.objective, -1, -int(requirement.is_met))
+
+    # objectives whose requirement list changed without their counters,
+    # i.e. a new requirement description, or which were edited themselves
+    touched = {objective.id for objective in session.dirty
+               if isinstance(objective, Objective) and
+               session.is_modified(objective)}
+
+    for requirement in session.dirty:
+        if not isinstance(requirement, Requirement) or \
+                not session.is_modified(requirement):
+            continue
+        touched.add(requirement.objective)
+        objective = get_history(requirement, 'objective')
+        is_met = get_history(requirement, 'is_met')
+        if not objective.has_changes() and not is_met.has_changes():
+            continue
+
+        old_objective = objective.deleted[0] if objective.deleted \
+            else requirement.objective
+        old_is_met = is_met.deleted[0] if is_met.deleted \
+            else requirement.is_met
+        add(old_objective, -1, -int(old_is_met))
+        add(requirement.objective, 1, int(requirement.is_met))
+
+    for objective, (total, met) in sorted(deltas.items()):
+        adjust_progress(objective, total, met, session=session)
+    touched -= {objective for objective, (total, met) in deltas.items()
+                if total or met}
+    if touched:
+        touch_objectives(touched, session)
+
+    bump_flushed_versions(session)
@@ -1,80 +1,203 @@
+import os
 import sys
-from flask import Flask, request, abort, jsonify, render_template
-from models import setup_db, Person, Objective, Requirement
+from flask import Flask, Response, request, abort, jsonify, \
+    render_template, stream_with_context
+from sqlalchemy.orm import joinedload
+from models import db, setup_db, current_versions, Person, Objective, \
+    Requirement
 from auth.auth import AuthError, requires_auth
+from okr.pagination import paginate_items, get_flag, MAX_ITEMS_PER_PAGE
+from okr.cache import TTLCache, LRUBackend, ResponseCache
+from okr.reports import progress_report
+from okr.export import iter_records, ndjson_lines, csv_lines, chunked
+from okr.metrics import RequestMetrics, pool_lines
+from okr.queries import QueryDetector, SLOW_QUERY_SECONDS, \
+    QUERY_REPEAT_LIMIT
+from okr.profiling import RequestProfiler, PROFILE_DIR, PROFILE_KEEP
+from okr.routing import use_replica, choose_replica
 
-ITEMS_PER_PAGE = 5
+REPORT_CACHE_TTL = 30
+RESPONSE_CACHE_SIZE = 1024
 
 
-def paginate_items(request, selection):
+def validate_requirements(items):
     """
-    This function takes the request with a list of items,
-    which are then paginated, and a list of max length
-    ITEMS_PER_PAGE is returned
+    This function checks a list of requirements from a request body,
+    each one a dict with a non-empty 'description'. Returns the
+    descriptions and a list of errors with the index of each bad item
     """
-    page = request.args.get('page', 1, type=int)
-    start = (page - 1) * ITEMS_PER_PAGE
-    end = start + ITEMS_PER_PAGE
+    descriptions = []
+    errors = []
 
-    items = [item.format() for item in selection]
-    current_items = items[start:end]
+    if not isinstance(items, list) or len(items) == 0:
+        return [], [{'index': None,
+                     'message': 'expected a non-empty list'}]
 
-    return current_items
+    for index, item in enumerate(items):
+        description = item.get('description') \
+            if isinstance(item, dict) else None
+        if not isinstance(description, str) or not description.strip():
+            errors.append({'index': index,
+                           'message': 'description missing'})
+        else:
+            descriptions.append(description)
+
+    return descriptions, errors
+
+
+def get_env_flag(name, default):
+    """
+    This function reads an on/off setting like METRICS_ENABLED=false
+    from the environment, `default` if it is not set
+    """
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.lower() in ('1', 'true', 'yes')
 
 
 def create_app(test_config=None):
     app = Flask(__name__)
+    app.config['MAX_ITEMS_PER_PAGE'] = int(
+        os.environ.get('MAX_ITEMS_PER_PAGE', MAX_ITEMS_PER_PAGE))
+    app.config['REPORT_CACHE_TTL'] = float(
+        os.environ.get('REPORT_CACHE_TTL', REPORT_CACHE_TTL))
+    app.config['RESPONSE_CACHE_SIZE'] = int(
+        os.environ.get('RESPONSE_CACHE_SIZE', RESPONSE_CACHE_SIZE))
+    app.config['METRICS_ENABLED'] = get_env_flag('METRICS_ENABLED', True)
+    app.config['SERVER_TIMING'] = get_env_flag('SERVER_TIMING', True)
+    app.config['QUERY_DETECTOR'] = get_env_flag('QUERY_DETECTOR', False)
+    app.config['QUERY_DETECTOR_STRICT'] = False
+    app.config['SLOW_QUERY_SECONDS'] = float(
+        os.environ.get('SLOW_QUERY_SECONDS', SLOW_QUERY_SECONDS))
+    app.config['QUERY_REPEAT_LIMIT'] = int(
+        os.environ.get('QUERY_REPEAT_LIMIT', QUERY_REPEAT_LIMIT))
+    app.config['PROFILE_SAMPLE_RATE'] = float(
+        os.environ.get('PROFILE_SAMPLE_RATE', 0))
+    app.config['PROFILE_DIR'] = os.environ.get('PROFILE_DIR', PROFILE_DIR)
+    app.config['PROFILE_KEEP'] = int(
+        os.environ.get('PROFILE_KEEP', PROFILE_KEEP))
+    if test_config is not None:
+        app.config.update(test_config)
     setup_db(app)
 
+    report_cache = TTLCache(ttl=app.config['REPORT_CACHE_TTL'])
+
+    # RESPONSE_CACHE_BACKEND can hold a shared backend (see okr/cache.py)
+    # RESPONSE_CACHE_SIZE = 0 switches caching off, ETags stay on
+    response_backend = app.config.get('RESPONSE_CACHE_BACKEND')
+    if response_backend is None and app.config['RESPONSE_CACHE_SIZE'] > 0:
+        response_backend = LRUBackend(app.config['RESPONSE_CACHE_SIZE'])
+    response_cache = ResponseCache(response_backend, current_versions)
+    app.extensions['response_cache'] = response_cache
+
+    # slow query and N+1 warnings, see okr/queries.py
+    if app.config['QUERY_DETECTOR']:
+        QueryDetector(slow_threshold=app.config['SLOW_QUERY_SECONDS'],
+                      repeat_limit=app.config['QUERY_REPEAT_LIMIT'],
+                      strict=app.config['QUERY_DETECTOR_STRICT']
+                      ).init_app(app)
+
+    # GET routes marked with use_replica read from a replica if there is
+    # one (DATABASE_REPLICA_URLS), see okr/routing.py
+    app.before_request(choose_replica)
+
+    # cProfile dumps of sampled or X-Profile requests, see okr/profiling.py
+    profiler = RequestProfiler(directory=app.config['PROFILE_DIR'],
+                               sample_rate=app.config['PROFILE_SAMPLE_RATE'],
+                               keep=app.config['PROFILE_KEEP'])
+    profiler.init_app(app)
+    app.extensions['profiler'] = profiler
+
+    # per route latency and query counts, see okr/metrics.py
+    if app.config['METRICS_ENABLED']:
+        metrics = RequestMetrics(server_timing=app.config['SERVER_TIMING'])
+        metrics.init_app(app)
+        metrics.add_collector(lambda: pool_lines(db.engine.pool))
+        app.extensions['metrics'] = metrics
+
+        @app.route('/metrics')
+        @requires_auth('get:metrics')
+        def retrieve_metrics(payload):
+            """
+            GET /metrics endpoint returns the request latency
+            histograms per route, status code and phase, the SQL
+            statements per request and the connection pool usage
+            in the Prometheus text format
+            Requires more than basic permissions
+            """
+            return Response(metrics.render(),
+                            mimetype='text/plain; version=0.0.4')
+
     @app.route('/persons')
+    @use_replica
     @requires_auth('get:persons')
+    @response_cache.cached(lambda: ['persons'])
     def retrieve_persons(payload):
         """
         GET /persons endpoint returns a list of persons
         working at the company.
+        Pagination through ?page= or ?cursor= and ?per_page=
+        Cached, answers If-None-Match with 304
         Requires basic permissions
         """
-        selection = Person.query.order_by(Person.id).all()
-        current_persons = paginate_items(request, selection)
+        selection = Person.query.order_by(Person.id)
+        current_persons, page = paginate_items(
+            request, selection, Person.id)
 
         if len(current_persons) == 0:
             abort(404)
 
         return jsonify({
             'success': True,
-            'persons': current_persons
+            'persons': current_persons,
+            **page
         })
 
     @app.route('/objectives')
+    @use_replica
     @requires_auth('get:objectives')
+    # objectives show the name of their person
+    @response_cache.cached(lambda: ['objectives', 'persons'])
     def retrieve_objectives(payload):
         """
         GET /objectives endpoint returns a list of all objectives
         from all persons at the company.
+        Pagination through ?page= or ?cursor= and ?per_page=
+        Cached, answers If-None-Match with 304
         Requires basic permissions
         """
-        selection = Objective.query.order_by(Objective.id).all()
-        current_objectives = paginate_items(request, selection)
+        selection = Objective.query.options(
+            joinedload(Objective.person_ref)).order_by(Objective.id)
+        current_objectives, page = paginate_items(
+            request, selection, Objective.id)
 
         if len(current_objectives) == 0:
             abort(404)
 
         return jsonify({
             'success': True,
-            'objectives': current_objectives
+            'objectives': current_objectives,
+            **page
         })
 
     @app.route('/objectives/<int:objective_id>/requirements')
+    @use_replica
     @requires_auth('get:requirements')
+    @response_cache.cached(
+        lambda objective_id: ['requirements:{}'.format(objective_id)])
     def retrieve_requirements(payload, objective_id):
         """
         GET /objectives/<id>/requirements endpoint returns a list of all
         requirements of a specific objective at the company.
+        Cached per version of the objective, answers If-None-Match
+        with 304
         Requires basic permissions
         """
-        selection = Requirement.query.filter(
-            Requirement.objective == objective_id).order_by(
-                Requirement.id).all()
+        selection = Requirement.query.options(
+            joinedload(Requirement.objectives_ref)).filter(
+                Requirement.objective == objective_id).order_by(
+                    Requirement.id).all()
 
         all_requirements = [item.format() for item in selection]
 
@@ -86,26 +209,81 @@ def create_app(test_config=None):
             'requirements': all_requirements
         })
 
+    @app.route('/reports/progress')
+    @use_replica
+    @requires_auth('get:reports')
+    def retrieve_progress_report(payload):
+        """
+        GET /reports/progress endpoint returns the percentage of met
+        requirements per objective, per person and company-wide in one
+        response, optionally filtered by ?person=<id> and ?is_boss=.
+        Computed with a single query and cached for REPORT_CACHE_TTL
+        seconds
+        Requires more than basic permissions
+        """
+        person = request.args.get('person', None, type=int)
+        if 'person' in request.args and person is None:
+            abort(400)
+
+        is_boss = None
+        if 'is_boss' in request.args:
+            is_boss = get_flag(request, 'is_boss')
+
+        key = (person, is_boss)
+        report = report_cache.get(key)
+        if report is None:
+            report = progress_report(person=person, is_boss=is_boss)
+            report_cache.set(key, report)
+
+        if person is not None and not report['persons']:
+            abort(404)
+
+        return jsonify({
+            'success': True,
+            'report': report
+        })
+
+    @app.route('/export')
+    @use_replica
+    @requires_auth('get:export')
+    def export_data(payload):
+        """
+        GET /export endpoint streams all persons, objectives and
+        requirements as NDJSON (default) or as CSV with ?format=csv.
+        Rows are read through a server-side cursor and written out
+        as they arrive, memory stays flat for any table size
+        Requires more than basic permissions
+        """
+        export_format = request.args.get('format', 'ndjson')
+        if export_format == 'ndjson':
+            lines, mimetype = ndjson_lines, 'application/x-ndjson'
+        elif export_format == 'csv':
+            lines, mimetype = csv_lines, 'text/csv'
+        else:
+            abort(400)
+
+        response = Response(
+            stream_with_context(chunked(lines(iter_records()))),
+            mimetype=mimetype)
+        response.headers['Content-Disposition'] = \
+            'attachment; filename=okr.{}'.format(export_format)
+        return response
+
     @app.route('/objectives/<int:objective_id>', methods=['DELETE'])
     @requires_auth('delete:objectives')
     def delete_objective(payload, objective_id):
         """
         DELETE /objectives/<id> endpoint deletes a specific
-        objective and all requirements part of it
+        objective and all requirements part of it with one
+        statement, the requirements are removed by ON DELETE CASCADE
         Requires more than basic permissions
         """
-        objective = Objective.query.filter(
-            Objective.id == objective_id).one_or_none()
-
-        if objective is None:
+        if not Objective.delete_by_id(objective_id):
             abort(404)
 
-        deleted_id = objective.id
-        objective.delete()
-
         return jsonify({
             'success': True,
-            'deleted_id': deleted_id
+            'deleted_id': objective_id
         })
 
     @app.route('/requirements/<int:requirement_id>', methods=['DELETE'])
@@ -135,39 +313,37 @@ def create_app(test_config=None):
     def update_requirement(payload, requirement_id):
         """
         PATCH /requirements/<id> endpoint updates a specific
-        requirement's status
+        requirement's status with a single conditional UPDATE
         Requires basic permissions
         """
-        try:
-            body = request.get_json()
-
-            assert requirement_id == body.get('requirement_id', None)
-
-            requirement = Requirement.query.filter(
-                Requirement.id == requirement_id).one_or_none()
+        body = request.get_json(silent=True)
+        if not isinstance(body, dict) or \
+                requirement_id != body.get('requirement_id', None):
+            abort(422)
 
-            if requirement is None:
-                abort(404)
+        objective_id = body.get('objective_id', None)
+        is_met = body.get('is_met', None)
+        if not isinstance(objective_id, int) or \
+                not isinstance(is_met, bool):
+            abort(422)
 
-            assert requirement.objective == body.get('objective_id', None)
+        try:
+            status = Requirement.set_status(requirement_id, objective_id,
+                                            is_met)
+        except ValueError:
+            abort(422)
 
-            previous_status = requirement.is_met
-            requirement.is_met = body.get('is_met', None)
-            requirement.update()
+        if status is None:
+            abort(404)
 
-            if previous_status != requirement.is_met:
-                updated = True
-            else:
-                updated = False
+        previous_status, updated = status
 
-            return jsonify({
-                'success': True,
-                'previous_status': previous_status,
-                'is_met': requirement.is_met,
-                'changed': updated
-            })
-        except:
-            abort(422)
+        return jsonify({
+            'success': True,
+            'previous_status': previous_status,
+            'is_met': is_met,
+            'changed': updated
+        })
 
     @app.route('/objectives/<int:objective_id>/requirements', methods=['POST'])
     @requires_auth('post:requirements')
@@ -175,17 +351,41 @@ def create_app(test_config=None):
         """
         POST /objectives/<id>/requirements endpoint creates a specific
         new requirement to one objective
+        A JSON array of requirements creates all of them in one
+        transaction
         Requires more than basic permissions
         """
-        try:
-            body = request.get_json()
+        body = request.get_json(silent=True)
 
-            objective = Objective.query.filter(
-                Objective.id == objective_id).one_or_none()
+        objective = Objective.query.filter(
+            Objective.id == objective_id).one_or_none()
 
-            if objective is None:
-                abort(404)
+        if objective is None:
+            abort(404)
 
+        if isinstance(body, list):
+            descriptions, errors = validate_requirements(body)
+            if errors:
+                return jsonify({
+                    'success': False,
+                    'error': 422,
+                    'message': 'request body malformed',
+                    'errors': errors
+                }), 422
+
+            try:
+                new_ids = Requirement.bulk_insert(objective.id, descriptions)
+            except Exception:
+                abort(422)
+
+            return jsonify({
+                'success': True,
+                'objective_id': objective_id,
+                'new_requirement_ids': new_ids,
+                'n_requirements': len(new_ids)
+            })
+
+        try:
             requirement = Requirement(body.get('description'), objective.id)
             requirement.insert()
 
@@ -202,26 +402,59 @@ def create_app(test_config=None):
     def new_objective(payload):
         """
         POST /objectives endpoint creates a specific
-        new objective with one single requirement
+        new objective together with all of its requirements
+        in one transaction. 'requirements' is a list of strings or
+        of objects with a 'description', a single string is
+        accepted as one requirement
         Requires more than basic permissions
         """
-        try:
-            body = request.get_json()
+        body = request.get_json(silent=True)
+        if not isinstance(body, dict):
+            abort(422)
 
-            objective = Objective(body.get('objective'),
-                                  body.get('person'))
-            objective.insert()
+        description = body.get('objective')
+        person = body.get('person')
+        if not isinstance(description, str) or not description.strip() \
+                or not isinstance(person, int):
+            abort(422)
 
-            requirement = Requirement(body.get('requirements'),
-                                      objective.id)
-            requirement.insert()
+        items = body.get('requirements')
+        if isinstance(items, str):
+            items = [items]
+        if isinstance(items, list):
+            items = [{'description': item} if isinstance(item, str)
+                     else item for item in items]
+
+        descriptions, errors = validate_requirements(items)
+        if errors:
+            return jsonify({
+                'success': False,
+                'error': 422,
+                'message': 'request body malformed',
+                'errors': errors
+            }), 422
+
+        try:
+            objective = Objective(description, person)
+            new_ids = objective.insert_with_requirements(descriptions)
 
             return jsonify({'success': True,
                             'objective_id': objective.id,
-                            'n_requirements': len(body.get('requirements'))})
-        except:
+                            'n_requirements': len(new_ids)})
+        except Exception:
             abort(422)
 
+    @app.errorhandler(400)
+    def bad_request(error):
+        '''
+        Example error handling for malformed URL parameters
+        '''
+        return jsonify({
+            'success': False,
+            'error': 400,
+            'message': 'bad request'
+        }), 400
+
     @app.errorhandler(404)
     def resource_not_found(error):
         '''
@@ -0,0 +1,194 @@
+import csv
+import json
+import tempfile
+
+from sqlalchemy import func, select
+
+from models import db, bump_versions, Person, Objective, Requirement
+
+# rows per executemany batch on databases without COPY
+LOAD_BATCH_SIZE = 10000
+
+LOAD_TABLES = [
+    ('person', Person, ('id', 'name', 'first_name', 'is_boss')),
+    ('objective', Objective, ('id', 'description', 'person',
+                              'requirements_total', 'requirements_met')),
+    ('requirement', Requirement, ('id', 'description', 'is_met',
+                                  'objective')),
+]
+
+# only these are referenced by other records and need an id map
+REFERENCED_TYPES = ('person', 'objective')
+
+INTEGER_FIELDS = ('id', 'person', 'objective')
+BOOLEAN_FIELDS = ('is_boss', 'is_met')
+
+
+def read_records(path, file_format=None):
+    """
+    This function yields the records of an export file, NDJSON or CSV
+    as written by GET /export. The format is guessed from the file
+    extension unless given
+    """
+    if file_format is None:
+        file_format = 'csv' if path.endswith('.csv') else 'ndjson'
+
+    with open(path, newline='') as file:
+        if file_format == 'ndjson':
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+        elif file_format == 'csv':
+            for row in csv.DictReader(file):
+                yield parse_csv_row(row)
+        else:
+            raise ValueError('unknown format {}'.format(file_format))
+
+
+def parse_csv_row(row):
+    record = {key: value for key, value in row.items() if value != ''}
+    for field in INTEGER_FIELDS:
+        if field in record:
+            record[field] = int(record[field])
+    for field in BOOLEAN_FIELDS:
+        if field in record:
+            record[field] = record[field].lower() in ('true', '1', 't')
+    return record
+
+
+class BulkLoader:
+    """
+    Loads export records into the database in one transaction.
+
+    The records may come in any order. They are spooled to temporary
+    files per table on a first pass, which also hands out new ids
+    above the current maximum of each table and counts the
+    requirements per objective. A second pass rewrites the foreign
+    keys in memory and streams every table through PostgreSQL COPY,
+    or through batched executemany on other databases
+    """
+
+    def __init__(self, session=None):
+        self.session = session or db.session
+        self.spools = {}
+        self.id_maps = {}
+        self.first_ids = {}
+        self.next_ids = {}
+        self.progress = {}
+
+    def load(self, records):
+        if self._is_postgresql():
+            # nobody may draw ids between reading the maximum and setval
+            self.session.execute(
+                'LOCK TABLE persons, objectives, requirements '
+                'IN SHARE ROW EXCLUSIVE MODE')
+
+        for record_type, model, columns in LOAD_TABLES:
+            self.spools[record_type] = tempfile.TemporaryFile('w+')
+            self.id_maps[record_type] = {}
+            self.first_ids[record_type] = (self.session.execute(
+                select([func.max(model.id)])).scalar() or 0) + 1
+            self.next_ids[record_type] = self.first_ids[record_type]
+
+        for record in records:
+            self._spool(record)
+
+        counts = {}
+        for record_type, model, columns in LOAD_TABLES:
+            counts[record_type] = self._write(record_type, model, columns)
+            self.spools[record_type].close()
+
+        bump_versions('persons', 'objectives', session=self.session)
+        self.session.commit()
+        return counts
+
+    def _spool(self, record):
+        record_type = record.get('type')
+        if record_type not in self.spools:
+            raise ValueError('unknown record type {}'.format(record_type))
+
+        # new ids follow the spool order, the second pass hands out the
+        # same sequence again without a map for unreferenced types
+        if record_type in REFERENCED_TYPES:
+            id_map = self.id_maps[record_type]
+            if record['id'] in id_map:
+                raise ValueError('duplicate {} id {}'.format(
+                    record_type, record['id']))
+            id_map[record['id']] = self.next_ids[record_type]
+        self.next_ids[record_type] += 1
+
+        if record_type == 'requirement':
+            total, met = self.progress.get(record['objective'], (0, 0))
+            self.progress[record['objective']] = (
+                total + 1, met + int(bool(record.get('is_met'))))
+
+        self.spools[record_type].write(json.dumps(record) + '\n')
+
+    def _rows(self, record_type, columns):
+        """
+        yields the spooled records of one table as tuples with the
+        new ids and foreign keys
+        """
+        spool = self.spools[record_type]
+        spool.seek(0)
+        for new_id, line in enumerate(spool, self.first_ids[record_type]):
+            record = json.loads(line)
+            old_id = record['id']
+            record['id'] = new_id
+
+            if record_type == 'objective':
+                record['person'] = self._resolve('person', record['person'])
+                total, met = self.progress.get(old_id, (0, 0))
+                record['requirements_total'] = total
+                record['requirements_met'] = met
+            if record_type == 'requirement':
+                record['is_met'] = bool(record.get('is_met'))
+                record['objective'] = self._resolve('objective',
+                                                    record['objective'])
+            yield tuple(record.get(column) for column in columns)
+
+    def _resolve(self, record_type, old_id):
+        try:
+            return self.id_maps[record_type][old_id]
+        except KeyError:
+            raise ValueError('unknown {} {} referenced'.format(record_type,
+                                                               old_id))
+
+    def _write(self, record_type, model, columns):
+        if self._is_postgresql():
+            return self._copy(record_type, model, columns)
+
+        table = model.__table__
+        count = 0
+        batch = []
+        for row in self._rows(record_type, columns):
+            batch.append(dict(zip(columns, row)))
+            if len(batch) >= LOAD_BATCH_SIZE:
+                self.session.execute(table.insert(), batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            self.session.execute(table.insert(), batch)
+            count += len(batch)
+        return count
+
+    def _copy(self, record_type, model, columns):
+        table = model.__tablename__
+        count = 0
+        with tempfile.TemporaryFile('w+', newline='') as buffer:
+            writer = csv.writer(buffer)
+            for row in self._rows(record_type, columns):
+                writer.writerow(row)
+                count += 1
+            buffer.seek(0)
+
+            cursor = self.session.connection().connection.cursor()
+            cursor.copy_expert('COPY {} ({}) FROM STDIN WITH (FORMAT csv)'
+                               .format(table, ', '.join(columns)), buffer)
+            cursor.execute(
+                "SELECT setval(pg_get_serial_sequence('{0}', 'id'), "
+                "(SELECT max(id) FROM {0}))".format(table))
+        return count
+
+    def _is_postgresql(self):
+        return self.session.get_bind().dialect.name == 'postgresql'
@@ -0,0 +1,187 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, make_response, request
+
+
+class TTLCache:
+    """
+    A small thread-safe in-process cache whose entries expire
+    `ttl` seconds after they were stored. At most `maxsize`
+    entries are kept, the least recently used one is dropped first
+    """
+
+    def __init__(self, ttl, maxsize=128, clock=time.monotonic):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.clock = clock
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            value, expires_at = entry
+            if self.clock() >= expires_at:
+                del self._entries[key]
+                return None
+
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if self.ttl <= 0:
+            return
+
+        with self._lock:
+            self._entries[key] = (value, self.clock() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class LRUBackend:
+    """
+    In-process response cache backend, keeps the `maxsize` most
+    recently used entries of this worker
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
+class ClientBackend:
+    """
+    Shared response cache backend on top of any client with the
+    get(key) and set(key, value, ex=seconds) calls of redis-py, so
+    all gunicorn workers share entries. Tests can pass a local
+    stand-in with the same two methods
+    """
+
+    def __init__(self, client, prefix='okr:', ttl=300):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        if isinstance(value, bytes):
+            value = value.decode('utf-8')
+        return value
+
+    def set(self, key, value):
+        self.client.set(self.prefix + key, value, ex=self.ttl)
+
+
+class ResponseCache:
+    """
+    Caches the JSON responses of read endpoints in a backend and
+    answers conditional requests with 304 through strong ETags.
+
+    Entries are keyed by path, query arguments, the permissions of the
+    token and the current version of every namespace the response
+    depends on. `versions` maps namespace names to their versions,
+    i.e. models.current_versions, which reads them from the database
+    so every worker sees a change the moment it is committed. Old
+    entries are never read again and simply age out of the backend.
+    The versions are also sent in the X-Data-Version header
+    """
+
+    def __init__(self, backend=None, versions=None):
+        self.backend = backend
+        self.versions = versions or (lambda namespaces: {})
+
+    def cached(self, namespaces):
+        """
+        Decorator for views taking the JWT payload as first argument.
+        `namespaces` maps the view arguments to the names of the data
+        the response depends on
+        """
+        def cached_decorator(f):
+            @wraps(f)
+            def wrapper(payload, *args, **kwargs):
+                # versions are read before the data, a response is never
+                # older than the versions it is stored under
+                versions = self.versions(namespaces(**kwargs))
+
+                response = None
+                if self.backend is not None:
+                    key = self._key(payload, versions)
+                    entry = self.backend.get(key)
+                    if entry is not None:
+                        response = self._from_entry(json.loads(entry))
+
+                if response is None:
+                    response = make_response(f(payload, *args, **kwargs))
+                    if response.status_code == 200:
+                        self._set_etag(response)
+                        if self.backend is not None:
+                            self.backend.set(key, self._to_entry(response))
+
+                response.headers['X-Data-Version'] = ', '.join(
+                    '{}={}'.format(name, version)
+                    for name, version in sorted(versions.items()))
+                return response.make_conditional(request)
+
+            return wrapper
+        return cached_decorator
+
+    @staticmethod
+    def _key(payload, versions):
+        raw = json.dumps([
+            request.path,
+            sorted(request.args.items(multi=True)),
+            sorted(payload.get('permissions', [])),
+            sorted(versions.items())
+        ])
+        return 'response:' + hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def _to_entry(response):
+        return json.dumps({
+            'body': response.get_data(as_text=True),
+            'status': response.status_code,
+            'mimetype': response.mimetype,
+            'etag': response.get_etag()[0]
+        })
+
+    @staticmethod
+    def _from_entry(entry):
+        response = current_app.response_class(
+            entry['body'], status=entry['status'],
+            mimetype=entry['mimetype'])
+        response.set_etag(entry['etag'])
+        return response
+
+    @staticmethod
+    def _set_etag(response):
+        response.set_etag(hashlib.sha1(response.get_data()).hexdigest())
@@ -0,0 +1,101 @@
+import csv
+import io
+import json
+
+from models import db, Person, Objective, Requirement
+
+# rows fetched per round trip from the server-side cursor
+EXPORT_BATCH_SIZE = 1000
+
+# record type, model and exported columns, in load order
+EXPORT_TABLES = [
+    ('person', Person, ('id', 'name', 'first_name', 'is_boss')),
+    ('objective', Objective, ('id', 'description', 'person')),
+    ('requirement', Requirement, ('id', 'description', 'is_met',
+                                  'objective')),
+]
+
+CSV_COLUMNS = ['type', 'id', 'name', 'first_name', 'is_boss',
+               'description', 'person', 'is_met', 'objective']
+
+
+def begin_snapshot(session):
+    """
+    Starts a new transaction on `session` in which every statement
+    sees the same snapshot. On PostgreSQL the default READ COMMITTED
+    gives each SELECT its own snapshot, so the transaction is switched
+    to REPEATABLE READ, READ ONLY. SQLite reads from one snapshot per
+    transaction anyway
+    """
+    session.rollback()
+    if session.get_bind().dialect.name == 'postgresql':
+        session.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, '
+                        'READ ONLY')
+
+
+def iter_records(batch_size=EXPORT_BATCH_SIZE):
+    """
+    This function yields every person, objective and requirement as
+    a flat dict with a 'type' key, in that order. The rows are read
+    as plain tuples through a server-side cursor (yield_per), so only
+    one batch is held in memory at any time. All three tables are read
+    in one transaction from the same snapshot, an objective written
+    during the export cannot show up without its person
+    """
+    begin_snapshot(db.session)
+    for record_type, model, columns in EXPORT_TABLES:
+        query = db.session.query(
+            *[getattr(model, column) for column in columns]
+        ).order_by(model.id).yield_per(batch_size)
+
+        for row in query:
+            record = {'type': record_type}
+            record.update(zip(columns, row))
+            yield record
+
+
+def ndjson_lines(records):
+    for record in records:
+        yield json.dumps(record) + '\n'
+
+
+def csv_lines(records):
+    """
+    All record types share one CSV, columns which do not apply to a
+    type are left empty
+    """
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=CSV_COLUMNS,
+                            lineterminator='\n')
+    writer.writeheader()
+    for record in records:
+        writer.writerow(record)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def chunked(lines, chunk_size=64 * 1024):
+    """
+    Joins lines into chunks of about `chunk_size` characters so the
+    server does not write every line separately. The first line goes
+    out on its own, the client gets its first byte right away
+    """
+    buffer = []
+    size = 0
+    first = True
+    for line in lines:
+        if first:
+            yield line
+            first = False
+            continue
+
+        buffer.append(line)
+        size += len(line)
+        if size >= chunk_size:
+            yield ''.join(buffer)
+            buffer = []
+            size = 0
+
+    if buffer:
+        yield ''.join(buffer)
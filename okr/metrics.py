@@ -0,0 +1,227 @@
+import bisect
+import threading
+import time
+
+from flask import g, request, has_app_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# seconds, from 1ms up to 10s
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                   0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+PHASES = ('auth', 'db', 'serialization', 'total')
+
+
+class Histogram:
+    """
+    A thread-safe Prometheus style histogram with one series per
+    label tuple. Observations are counted in their bucket only, the
+    cumulative counts are built when rendering
+    """
+
+    def __init__(self, name, description, label_names, buckets):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self.buckets = tuple(buckets)
+
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [
+                    [0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def snapshot(self):
+        """Returns {labels: (cumulative bucket counts, sum, count)}"""
+        with self._lock:
+            series = {labels: (list(counts), total, count)
+                      for labels, (counts, total, count)
+                      in self._series.items()}
+
+        for labels, (counts, total, count) in series.items():
+            for index in range(1, len(counts)):
+                counts[index] += counts[index - 1]
+        return series
+
+    def render(self):
+        lines = ['# HELP {} {}'.format(self.name, self.description),
+                 '# TYPE {} histogram'.format(self.name)]
+        bounds = [format_value(bound) for bound in self.buckets] + ['+Inf']
+        for labels, (counts, total, count) in sorted(
+                self.snapshot().items()):
+            label_text = format_labels(zip(self.label_names, labels))
+            for bound, cumulative in zip(bounds, counts):
+                lines.append('{}_bucket{{{}le="{}"}} {}'.format(
+                    self.name, label_text + ',' if label_text else '',
+                    bound, cumulative))
+            lines.append('{}_sum{{{}}} {}'.format(
+                self.name, label_text, format_value(total)))
+            lines.append('{}_count{{{}}} {}'.format(
+                self.name, label_text, count))
+        return lines
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def format_labels(pairs):
+    return ','.join('{}="{}"'.format(
+        name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+        for name, value in pairs)
+
+
+class RequestTiming:
+    """Phase timings of the request being served, kept in flask.g"""
+
+    __slots__ = ('start', 'db', 'queries', 'query_start')
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.db = 0.0
+        self.queries = 0
+        self.query_start = None
+
+
+'''
+SQL statements are timed by listeners on every Engine, which only
+record something while a request with metrics enabled is served
+'''
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    timing = g.get('request_timing') if has_app_context() else None
+    if timing is not None:
+        timing.query_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    timing = g.get('request_timing') if has_app_context() else None
+    if timing is not None and timing.query_start is not None:
+        timing.db += time.perf_counter() - timing.query_start
+        timing.query_start = None
+        timing.queries += 1
+
+
+def listen_for_queries():
+    if not event.contains(Engine, 'before_cursor_execute',
+                          _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+class RequestMetrics:
+    """
+    Records per route, method and status code how long requests take,
+    split into phases, and how many SQL statements they issue.
+
+    - auth: bearer token checks, recorded by requires_auth into
+      g.auth_seconds
+    - db: time spent in cursor.execute
+    - serialization: everything else, view logic and building the
+      response
+    - total: from before_request to after_request. Streamed bodies
+      (GET /export) are only timed until the first byte is ready
+
+    The numbers are per worker process
+    """
+
+    def __init__(self, server_timing=True):
+        self.server_timing = server_timing
+        self.latency = Histogram(
+            'okr_request_duration_seconds',
+            'Request latency per phase',
+            ('route', 'method', 'status', 'phase'), LATENCY_BUCKETS)
+        self.queries = Histogram(
+            'okr_request_queries',
+            'SQL statements per request',
+            ('route', 'method', 'status'), QUERY_BUCKETS)
+        self.collectors = []
+
+    def init_app(self, app):
+        listen_for_queries()
+        app.before_request(self.start_request)
+        app.after_request(self.finish_request)
+
+    def add_collector(self, collector):
+        """Registers a callable returning more lines for render()"""
+        self.collectors.append(collector)
+
+    def start_request(self):
+        g.request_timing = RequestTiming()
+
+    def finish_request(self, response):
+        timing = g.get('request_timing')
+        if timing is None:
+            return response
+
+        total = time.perf_counter() - timing.start
+        auth = g.get('auth_seconds', 0.0)
+        serialization = max(total - auth - timing.db, 0.0)
+
+        rule = request.url_rule
+        route = rule.rule if rule is not None else 'unmatched'
+        status = str(response.status_code)
+        labels = (route, request.method, status)
+
+        for phase, seconds in zip(PHASES, (auth, timing.db, serialization,
+                                           total)):
+            self.latency.observe(labels + (phase,), seconds)
+        self.queries.observe(labels, timing.queries)
+
+        if self.server_timing:
+            response.headers['Server-Timing'] = ', '.join([
+                'auth;dur={:.2f}'.format(auth * 1000),
+                'db;dur={:.2f};desc="{} queries"'.format(
+                    timing.db * 1000, timing.queries),
+                'serialization;dur={:.2f}'.format(serialization * 1000),
+                'total;dur={:.2f}'.format(total * 1000)])
+        return response
+
+    def render(self):
+        lines = self.latency.render() + self.queries.render()
+        for collector in self.collectors:
+            lines.extend(collector())
+        return '\n'.join(lines) + '\n'
+
+
+def pool_lines(pool):
+    """
+    Prometheus lines for a models.TimedQueuePool: size, checked-out
+    and overflow connections and the time spent waiting for one
+    """
+    if not hasattr(pool, 'wait_seconds'):
+        return []
+
+    gauges = (
+        ('okr_db_pool_size', 'gauge', 'Connections kept in the pool',
+         pool.size()),
+        ('okr_db_pool_checked_out', 'gauge', 'Connections in use',
+         pool.checkedout()),
+        ('okr_db_pool_overflow', 'gauge',
+         'Connections opened beyond the pool size', max(pool.overflow(), 0)),
+        ('okr_db_pool_wait_seconds_total', 'counter',
+         'Time spent waiting for a connection', pool.wait_seconds),
+        ('okr_db_pool_checkouts_total', 'counter', 'Connection checkouts',
+         pool.waits),
+        ('okr_db_pool_timeouts_total', 'counter',
+         'Checkouts which gave up waiting', pool.timeouts))
+
+    lines = []
+    for name, kind, description, value in gauges:
+        lines.extend(['# HELP {} {}'.format(name, description),
+                      '# TYPE {} {}'.format(name, kind),
+                      '{} {}'.format(name, format_value(value))])
+    return lines
@@ -0,0 +1,106 @@
+import base64
+import json
+
+from flask import abort, current_app
+
+ITEMS_PER_PAGE = 5
+MAX_ITEMS_PER_PAGE = 100
+
+
+def get_flag(request, name):
+    """
+    Reads a boolean URL parameter like ?include_total=true
+    """
+    return request.args.get(name, 'false').lower() in ('1', 'true', 'yes')
+
+
+def get_per_page(request):
+    """
+    Returns the page size requested through ?per_page=, clamped
+    between 1 and the configured MAX_ITEMS_PER_PAGE
+    """
+    default = current_app.config.get('ITEMS_PER_PAGE', ITEMS_PER_PAGE)
+    cap = current_app.config.get('MAX_ITEMS_PER_PAGE', MAX_ITEMS_PER_PAGE)
+    per_page = request.args.get('per_page', default, type=int)
+
+    return max(1, min(per_page, cap))
+
+
+def encode_cursor(value):
+    """
+    Wraps the key of the last item of a page into an opaque cursor
+    """
+    raw = json.dumps({'after': value}).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Returns the key stored in a cursor, aborts with 400 if the
+    cursor was not created by encode_cursor
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        value = json.loads(base64.urlsafe_b64decode(padded))['after']
+    except Exception:
+        abort(400)
+
+    if not isinstance(value, int):
+        abort(400)
+
+    return value
+
+
+def paginate_items(request, query, key=None):
+    """
+    This function takes the request and an ordered query, which is
+    paginated in the database with LIMIT/OFFSET. Only the rows of the
+    requested page are loaded and formatted. Returns the formatted
+    items together with the page metadata
+
+    If a unique sort `key` column is given and the request carries
+    ?cursor=, keyset pagination is used instead (see paginate_keyset)
+    """
+    if key is not None and 'cursor' in request.args:
+        return paginate_keyset(request, query, key)
+
+    page = request.args.get('page', 1, type=int)
+    per_page = get_per_page(request)
+    meta = {'page': page, 'per_page': per_page}
+
+    if page < 1:
+        return [], meta
+
+    selection = query.limit(per_page).offset((page - 1) * per_page).all()
+    current_items = [item.format() for item in selection]
+
+    if get_flag(request, 'include_total'):
+        meta['total'] = query.order_by(None).count()
+
+    return current_items, meta
+
+
+def paginate_keyset(request, query, key):
+    """
+    Keyset pagination: instead of skipping OFFSET rows the query
+    continues right after the key of the previous page, so every page
+    costs the same as the first one. An empty ?cursor= starts at the
+    beginning, `next_cursor` is None on the last page
+    """
+    per_page = get_per_page(request)
+    cursor = request.args.get('cursor')
+
+    if cursor:
+        query = query.filter(key > decode_cursor(cursor))
+
+    selection = query.order_by(None).order_by(key).limit(per_page + 1).all()
+    has_more = len(selection) > per_page
+    selection = selection[:per_page]
+
+    next_cursor = None
+    if has_more:
+        next_cursor = encode_cursor(getattr(selection[-1], key.key))
+
+    current_items = [item.format() for item in selection]
+
+    return current_items, {'per_page': per_page, 'next_cursor': next_cursor}
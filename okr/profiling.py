@@ -0,0 +1,127 @@
+import cProfile
+import glob
+import logging
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+
+from flask import g, request
+
+from auth.auth import AuthError, check_permissions, \
+    get_token_auth_header, verify_decode_jwt
+
+PROFILE_PERMISSION = 'profile:requests'
+PROFILE_HEADER = 'X-Profile'
+PROFILE_KEEP = 50
+PROFILE_DIR = os.path.join(tempfile.gettempdir(), 'okr-profiles')
+
+logger = logging.getLogger('okr.profiling')
+
+
+def profile_requested():
+    """
+    True if the request asks for a profile with the X-Profile header
+    and its bearer token carries the profile:requests permission.
+    A missing or weak token just means no profile, the request itself
+    is authorized by its route later. The token is checked without
+    requires_auth, whose timing would count towards the auth phase of
+    the request metrics before they start
+    """
+    if PROFILE_HEADER not in request.headers:
+        return False
+    try:
+        check_permissions(PROFILE_PERMISSION,
+                          verify_decode_jwt(get_token_auth_header()))
+    except AuthError:
+        return False
+    return True
+
+
+class RequestProfiler:
+    """
+    Runs cProfile for a sampled share of the requests and for requests
+    with an authorized X-Profile header. Every profile is dumped to a
+    .prof file in `directory`, only the `keep` newest files are kept,
+    i.e. for snakeviz, flameprof or python -m pstats.
+
+    Only one request per worker is profiled at a time, a request
+    arriving while another one is profiled is served unprofiled. A
+    profile which cannot be written is logged, the response is sent
+    without it
+    """
+
+    def __init__(self, directory=PROFILE_DIR, sample_rate=0.0,
+                 keep=PROFILE_KEEP, sample=random.random):
+        if keep < 1:
+            raise ValueError('keep must be at least 1, got {}'.format(keep))
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.keep = keep
+        self.sample = sample
+
+        self._busy = threading.Lock()
+
+    def init_app(self, app):
+        app.before_request(self.start_request)
+        app.after_request(self.finish_request)
+        # a request failing with an unhandled error skips after_request
+        app.teardown_request(self.teardown_request)
+
+    def start_request(self):
+        requested = profile_requested()
+        if not requested and (self.sample_rate <= 0 or
+                              self.sample() >= self.sample_rate):
+            return
+        if not self._busy.acquire(blocking=False):
+            return
+
+        g.profile_requested = requested
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+    def finish_request(self, response):
+        profiler = g.pop('profiler', None)
+        if profiler is None:
+            return response
+
+        try:
+            profiler.disable()
+            path = self.dump(profiler)
+        except Exception:
+            logger.exception('could not write the profile to %s',
+                             self.directory)
+            return response
+        finally:
+            self._busy.release()
+
+        if g.get('profile_requested'):
+            response.headers['X-Profile-File'] = os.path.basename(path)
+        return response
+
+    def teardown_request(self, error=None):
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            profiler.disable()
+            self._busy.release()
+
+    def dump(self, profiler):
+        os.makedirs(self.directory, exist_ok=True)
+        rule = request.url_rule
+        route = re.sub(r'[^A-Za-z0-9]+', '_',
+                       rule.rule if rule is not None else 'unmatched')
+        path = os.path.join(self.directory, '{:.6f}-{}-{}{}.prof'.format(
+            time.time(), os.getpid(), request.method, route.rstrip('_')))
+        profiler.dump_stats(path)
+
+        profiles = sorted(glob.glob(os.path.join(self.directory, '*.prof')),
+                          key=os.path.getmtime)
+        for old in profiles[:-self.keep]:
+            try:
+                os.remove(old)
+            except OSError:
+                # already removed by another worker
+                pass
+        return path
@@ -0,0 +1,106 @@
+import logging
+import time
+from collections import Counter
+
+from flask import current_app, g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+SLOW_QUERY_SECONDS = 0.5
+QUERY_REPEAT_LIMIT = 10
+
+logger = logging.getLogger('okr.queries')
+
+
+class QueryRegression(AssertionError):
+    """Raised by a strict QueryDetector when a request repeats statements"""
+
+
+def repeated_statements(statements, limit):
+    """
+    Returns [(statement, count)] for every parameterized statement
+    which occurs more than `limit` times, the usual sign of a lazy
+    relationship loaded once per row (N+1)
+    """
+    return [(statement, count)
+            for statement, count in Counter(statements).most_common()
+            if count > limit]
+
+
+def _detector():
+    if not has_app_context():
+        return None
+    return current_app.extensions.get('query_detector')
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    if context is not None and _detector() is not None:
+        context._okr_detector_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    started = getattr(context, '_okr_detector_start', None)
+    if started is not None:
+        _detector().record(statement, time.perf_counter() - started)
+
+
+def listen_for_queries():
+    if not event.contains(Engine, 'before_cursor_execute',
+                          _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+class QueryDetector:
+    """
+    Opt-in watchdog on the SQL statements of an app.
+
+    - statements slower than `slow_threshold` seconds are logged
+      with their duration, without the parameters
+    - requests which run the same parameterized statement more than
+      `repeat_limit` times are logged as N+1 suspects
+
+    With `strict` the N+1 case raises QueryRegression instead, with
+    TESTING on it reaches the test client and fails the test
+    """
+
+    def __init__(self, slow_threshold=SLOW_QUERY_SECONDS,
+                 repeat_limit=QUERY_REPEAT_LIMIT, strict=False):
+        self.slow_threshold = slow_threshold
+        self.repeat_limit = repeat_limit
+        self.strict = strict
+
+    def init_app(self, app):
+        listen_for_queries()
+        app.extensions['query_detector'] = self
+        app.before_request(self.start_request)
+        app.after_request(self.finish_request)
+
+    def start_request(self):
+        g.query_statements = []
+
+    def record(self, statement, seconds):
+        if seconds > self.slow_threshold:
+            logger.warning('slow query (%.3fs): %s', seconds, statement)
+
+        statements = g.get('query_statements')
+        if statements is not None:
+            statements.append(statement)
+
+    def finish_request(self, response):
+        statements = g.pop('query_statements', None)
+        if not statements:
+            return response
+
+        repeated = repeated_statements(statements, self.repeat_limit)
+        if repeated:
+            message = '{} {} repeated statements (N+1?):\n{}'.format(
+                request.method, request.path, '\n'.join(
+                    '{}x {}'.format(count, statement)
+                    for statement, count in repeated))
+            if self.strict:
+                raise QueryRegression(message)
+            logger.warning(message)
+        return response
@@ -0,0 +1,78 @@
+from sqlalchemy import select
+
+from models import db, Person, Objective
+
+
+def percent(met, total):
+    return round(100.0 * met / total, 1) if total else None
+
+
+def progress_report(person=None, is_boss=None):
+    """
+    This function builds the OKR progress roll-up per objective,
+    per person and for the whole company.
+
+    All numbers come from one SELECT over persons joined with the
+    progress counters kept on objectives, so the requirements table
+    is not scanned at all. Optionally limited to one person and/or
+    to bosses or employees
+    """
+    persons = Person.__table__
+    objectives = Objective.__table__
+
+    query = select([
+        persons.c.id, persons.c.name, persons.c.first_name,
+        persons.c.is_boss,
+        objectives.c.id.label('objective_id'), objectives.c.description,
+        objectives.c.requirements_total, objectives.c.requirements_met
+    ]).select_from(
+        persons.outerjoin(objectives, objectives.c.person == persons.c.id)
+    ).order_by(persons.c.id, objectives.c.id)
+
+    if person is not None:
+        query = query.where(persons.c.id == person)
+    if is_boss is not None:
+        query = query.where(persons.c.is_boss == is_boss)
+
+    report_persons = []
+    company_total = 0
+    company_met = 0
+
+    for row in db.session.execute(query):
+        if not report_persons or report_persons[-1]['id'] != row.id:
+            report_persons.append({
+                'id': row.id,
+                'name': row.name,
+                'first_name': row.first_name,
+                'is_boss': row.is_boss,
+                'requirements_total': 0,
+                'requirements_met': 0,
+                'objectives': []
+            })
+        if row.objective_id is None:
+            continue
+
+        entry = report_persons[-1]
+        entry['objectives'].append({
+            'id': row.objective_id,
+            'description': row.description,
+            'requirements_total': row.requirements_total,
+            'requirements_met': row.requirements_met,
+            'percent_met': percent(row.requirements_met,
+                                   row.requirements_total)
+        })
+        entry['requirements_total'] += row.requirements_total
+        entry['requirements_met'] += row.requirements_met
+        company_total += row.requirements_total
+        company_met += row.requirements_met
+
+    for entry in report_persons:
+        entry['percent_met'] = percent(entry['requirements_met'],
+                                       entry['requirements_total'])
+
+    return {
+        'requirements_total': company_total,
+        'requirements_met': company_met,
+        'percent_met': percent(company_met, company_total),
+        'persons': report_persons
+    }
@@ -0,0 +1,37 @@
+from flask import current_app, g, request
+
+CONSISTENCY_HEADER = 'X-Consistency'
+
+
+def use_replica(f):
+    """
+    Marks a read-only view, its queries may be answered by a read
+    replica (see models.ReplicaSet). Views without it use the primary
+    """
+    f.use_replica = True
+    return f
+
+
+def reads_from_replica():
+    """
+    True if the current request may use a replica: its view is marked
+    with use_replica, or listed in the REPLICA_ENDPOINTS config if that
+    is set, and the client did not ask for X-Consistency: strong, i.e.
+    to read its own writes
+    """
+    endpoints = current_app.config.get('REPLICA_ENDPOINTS')
+    if endpoints is not None:
+        selected = request.endpoint in endpoints
+    else:
+        view = current_app.view_functions.get(request.endpoint)
+        selected = getattr(view, 'use_replica', False)
+
+    consistency = request.headers.get(CONSISTENCY_HEADER, '')
+    return selected and consistency.lower() != 'strong'
+
+
+def choose_replica():
+    """before_request hook, puts the replica engine into g.db_replica"""
+    replicas = current_app.extensions.get('replicas')
+    if replicas and reads_from_replica():
+        g.db_replica = replicas.choose()
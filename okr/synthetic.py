@@ -0,0 +1,73 @@
+import random
+
+NAMES = ['Mustermann', 'Li', 'Mendez', 'Schmidt', 'Nguyen', 'Okafor',
+         'Kowalski', 'Rossi', 'Tanaka', 'Silva', 'Novak', 'Haddad']
+FIRST_NAMES = ['Max', 'Ali', 'Maria', 'Anna', 'Chen', 'Ngozi', 'Piotr',
+               'Giulia', 'Yuki', 'Joao', 'Eva', 'Omar']
+OBJECTIVES = ['Grow revenue', 'Improve onboarding', 'Reduce churn',
+              'Ship the new app', 'Hire a strong team', 'Cut cloud costs',
+              'Raise customer satisfaction', 'Automate reporting']
+REQUIREMENTS = ['Write the proposal', 'Get budget approval',
+                'Run the pilot', 'Collect feedback', 'Present results',
+                'Document the process', 'Train the team',
+                'Review with stakeholders', 'Fix open issues',
+                'Measure the outcome']
+
+
+def parse_range(value):
+    """
+    Turns '3' into (3, 3) and '1-5' into (1, 5)
+    """
+    low, _, high = str(value).partition('-')
+    low = int(low)
+    high = int(high) if high else low
+    if low < 0 or high < low:
+        raise ValueError('invalid range {}'.format(value))
+    return low, high
+
+
+def generate_records(persons, objectives_per_person=(1, 5),
+                     requirements_per_objective=(1, 10), met_ratio=0.3,
+                     boss_ratio=0.1, seed=0):
+    """
+    This function yields a synthetic organisation in the record format
+    of GET /export: `persons` persons, each with a uniformly drawn
+    number of objectives in the `objectives_per_person` range, each
+    objective with a number of requirements in the
+    `requirements_per_objective` range, of which about `met_ratio`
+    are met. The same seed always produces the same data.
+
+    Records are generated lazily and can be handed to BulkLoader
+    without ever holding the data set in memory
+    """
+    rng = random.Random(seed)
+    objective_id = 0
+    requirement_id = 0
+
+    for person_id in range(1, persons + 1):
+        yield {
+            'type': 'person',
+            'id': person_id,
+            'name': rng.choice(NAMES),
+            'first_name': rng.choice(FIRST_NAMES),
+            'is_boss': rng.random() < boss_ratio
+        }
+
+        for _ in range(rng.randint(*objectives_per_person)):
+            objective_id += 1
+            yield {
+                'type': 'objective',
+                'id': objective_id,
+                'description': rng.choice(OBJECTIVES),
+                'person': person_id
+            }
+
+            for _ in range(rng.randint(*requirements_per_objective)):
+                requirement_id += 1
+                yield {
+                    'type': 'requirement',
+                    'id': requirement_id,
+                    'description': rng.choice(REQUIREMENTS),
+                    'is_met': rng.random() < met_ratio,
+                    'objective': objective_id
+                }
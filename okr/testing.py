@@ -0,0 +1,67 @@
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from okr.queries import repeated_statements
+
+
+class QueryCounter:
+    """
+    Collects every SQL statement sent through an engine while active
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._record)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._record)
+
+    def _record(self, conn, cursor, statement, parameters, context,
+                executemany):
+        self.statements.append(statement)
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+
+@contextmanager
+def assert_max_queries(engine, max_queries):
+    """
+    Fails with an AssertionError listing the statements if the block
+    issues more than `max_queries` SQL statements, i.e.
+
+        with assert_max_queries(db.engine, 1):
+            client.get('/objectives', headers=...)
+    """
+    with QueryCounter(engine) as counter:
+        yield counter
+
+    if counter.count > max_queries:
+        raise AssertionError(
+            '{} queries issued, expected at most {}:\n{}'.format(
+                counter.count, max_queries, '\n'.join(counter.statements)))
+
+
+@contextmanager
+def assert_no_repeated_queries(engine, max_repeats=1):
+    """
+    Fails with an AssertionError if the block runs the same
+    parameterized statement more than `max_repeats` times, the
+    signature of an N+1 lazy load
+    """
+    with QueryCounter(engine) as counter:
+        yield counter
+
+    repeated = repeated_statements(counter.statements, max_repeats)
+    if repeated:
+        lines = ['{}x {}'.format(count, statement)
+                 for statement, count in repeated]
+        raise AssertionError(
+            'statements repeated more than {} times:\n{}'.format(
+                max_repeats, '\n'.join(lines)))
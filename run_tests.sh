@@ -3,3 +3,4 @@ createdb okr_test_local
 flask db upgrade
 python create_dummy_data.py
 python test_okr.py
+python test_auth.py
@@ -0,0 +1,236 @@
+import unittest
+import json
+import os
+import tempfile
+from unittest import mock
+
+from jose import jwt
+
+import auth.auth
+from auth.auth import AuthError, configure, verify_decode_jwt
+from auth.jwks import JWKSKeyStore, file_fetcher
+from auth.testing import LocalKeyPair, use_local_keys
+from auth.token_cache import TokenCache
+
+
+def make_jwks(*kids):
+    return {'keys': [{'kty': 'RSA', 'kid': kid, 'use': 'sig',
+                      'n': 'n-' + kid, 'e': 'AQAB'} for kid in kids]}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeFetcher:
+    """Local stand-in for the Auth0 /.well-known/jwks.json endpoint"""
+
+    def __init__(self, *kids):
+        self.jwks = make_jwks(*kids)
+        self.calls = 0
+        self.fail = False
+
+    def __call__(self):
+        self.calls += 1
+        if self.fail:
+            raise OSError('IdP unreachable')
+        return self.jwks
+
+
+class JWKSKeyStoreTestCase(unittest.TestCase):
+    """This class represents the JWKS key store test case"""
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.fetcher = FakeFetcher('a')
+        self.store = JWKSKeyStore(self.fetcher, ttl=100, refresh_ahead=10,
+                                  miss_interval=30, clock=self.clock)
+        # run background refreshes inline to keep the tests deterministic
+        self.store._refresh_in_background = self.store.refresh
+
+    def test_keys_are_fetched_once(self):
+        for _ in range(10):
+            self.assertEqual(self.store.get_key('a')['n'], 'n-a')
+
+        self.assertEqual(self.fetcher.calls, 1)
+
+    def test_refresh_before_expiry(self):
+        self.store.get_key('a')
+        self.clock.now = 95
+        self.store.get_key('a')
+
+        self.assertEqual(self.fetcher.calls, 2)
+
+    def test_unknown_kid_refetch_is_rate_limited(self):
+        self.store.get_key('a')
+        self.fetcher.jwks = make_jwks('a', 'b')
+
+        self.assertEqual(self.store.get_key('b')['kid'], 'b')
+        self.assertIsNone(self.store.get_key('c'))
+        self.assertIsNone(self.store.get_key('d'))
+        self.assertEqual(self.fetcher.calls, 2)
+
+        self.clock.now = 31
+        self.assertIsNone(self.store.get_key('d'))
+        self.assertEqual(self.fetcher.calls, 3)
+
+    def test_stale_keys_served_when_refresh_fails(self):
+        self.store.get_key('a')
+        self.fetcher.fail = True
+        self.clock.now = 500
+
+        self.assertEqual(self.store.get_key('a')['kid'], 'a')
+        self.assertEqual(self.store.get_key('a')['kid'], 'a')
+        self.assertEqual(self.fetcher.calls, 2)
+
+    def test_keys_other_than_rsa_are_skipped(self):
+        self.fetcher.jwks['keys'].extend([
+            {'kty': 'EC', 'kid': 'ec', 'crv': 'P-256', 'x': 'x', 'y': 'y'},
+            {'kty': 'oct', 'kid': 'oct', 'k': 'secret'},
+            {'kty': 'RSA', 'kid': 'no-modulus', 'e': 'AQAB'}])
+
+        self.assertEqual(self.store.get_key('a')['kid'], 'a')
+        self.assertIsNone(self.store.get_key('ec'))
+        self.assertIsNone(self.store.get_key('oct'))
+        self.assertIsNone(self.store.get_key('no-modulus'))
+
+    def test_stale_keys_served_when_key_set_is_malformed(self):
+        self.store.get_key('a')
+        self.fetcher.jwks = ['not', 'a', 'key', 'set']
+        self.clock.now = 500
+
+        self.assertEqual(self.store.get_key('a')['kid'], 'a')
+        self.assertEqual(self.store.get_key('a')['kid'], 'a')
+        self.assertEqual(self.fetcher.calls, 2)
+
+    def test_rotation_listeners_receive_removed_kids(self):
+        rotated = []
+        self.store.on_rotate(rotated.append)
+        self.store.get_key('a')
+        self.fetcher.jwks = make_jwks('b')
+        self.store.refresh()
+
+        self.assertEqual(rotated, [{'a'}])
+
+
+class TokenCacheTestCase(unittest.TestCase):
+    """This class represents the verified token cache test case"""
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = TokenCache(maxsize=2, clock=self.clock)
+
+    def test_hit_until_exp(self):
+        self.cache.put('token', {'sub': 'x', 'exp': 10}, 'a')
+
+        self.assertEqual(self.cache.get('token')['sub'], 'x')
+        self.assertIsNone(self.cache.get('other-token'))
+
+        self.clock.now = 10
+        self.assertIsNone(self.cache.get('token'))
+
+    def test_lru_eviction(self):
+        self.cache.put('t1', {'exp': 10}, 'a')
+        self.cache.put('t2', {'exp': 10}, 'a')
+        self.cache.get('t1')
+        self.cache.put('t3', {'exp': 10}, 'a')
+
+        self.assertIsNotNone(self.cache.get('t1'))
+        self.assertIsNone(self.cache.get('t2'))
+        self.assertIsNotNone(self.cache.get('t3'))
+
+    def test_evicted_on_key_rotation(self):
+        self.cache.put('t1', {'exp': 10}, 'a')
+        self.cache.put('t2', {'exp': 10}, 'b')
+        self.cache.evict_kids({'a'})
+
+        self.assertIsNone(self.cache.get('t1'))
+        self.assertIsNotNone(self.cache.get('t2'))
+
+    def test_tokens_without_exp_are_not_cached(self):
+        self.cache.put('token', {'sub': 'x'}, 'a')
+
+        self.assertIsNone(self.cache.get('token'))
+
+
+class LocalKeyPairTestCase(unittest.TestCase):
+    def test_minted_token_verifies_against_its_jwks(self):
+        keys = LocalKeyPair(kid='local')
+        store = JWKSKeyStore(keys.jwks)
+        token = keys.mint(['get:persons'], 'https://okr.test/', 'okr')
+
+        kid = jwt.get_unverified_header(token)['kid']
+        payload = jwt.decode(token, store.get_key(kid), algorithms='RS256',
+                             audience='okr', issuer='https://okr.test/')
+
+        self.assertEqual(payload['permissions'], ['get:persons'])
+        with self.assertRaises(jwt.JWTClaimsError):
+            jwt.decode(token, store.get_key(kid), algorithms='RS256',
+                       audience='other', issuer='https://okr.test/')
+
+
+class KeySourceTestCase(unittest.TestCase):
+    def test_switching_source_drops_keys(self):
+        store = JWKSKeyStore(FakeFetcher('old'), clock=FakeClock())
+        removed = []
+        store.on_rotate(removed.append)
+        self.assertIsNotNone(store.get_key('old'))
+
+        store.use(FakeFetcher('new'))
+
+        self.assertEqual(removed, [{'old'}])
+        self.assertIsNotNone(store.get_key('new'))
+        self.assertIsNone(store.get_key('old'))
+
+    def test_verify_against_local_jwks_file(self):
+        keys = LocalKeyPair(kid='file', issuer='https://okr.file/',
+                            audience='okr')
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'jwks.json')
+            with open(path, 'w') as file:
+                json.dump(keys.jwks(), file)
+            self.assertEqual(file_fetcher(path)(), keys.jwks())
+
+            configure(issuer='https://okr.file/', audience='okr',
+                      jwks_file=path)
+            payload = verify_decode_jwt(keys.mint(['get:persons']))
+
+        self.assertEqual(payload['permissions'], ['get:persons'])
+
+    def test_verify_against_in_memory_keys(self):
+        keys = use_local_keys()
+        payload = verify_decode_jwt(keys.mint(['get:objectives']))
+        self.assertEqual(payload['permissions'], ['get:objectives'])
+
+        other = LocalKeyPair(kid='local-test-key', issuer=keys.issuer,
+                             audience=keys.audience)
+        with self.assertRaises(AuthError):
+            verify_decode_jwt(other.mint(['get:objectives']))
+
+    def test_missing_issuer_or_audience_is_an_error(self):
+        keys = LocalKeyPair(kid='unchecked', issuer='https://anyone/',
+                            audience='anything')
+        saved = dict(auth.auth._settings)
+        environ = {'JWKS_URL': 'https://keys.example/jwks.json'}
+        try:
+            with mock.patch.dict(os.environ, environ, clear=True):
+                auth.auth._settings.clear()
+                configure(jwks=keys.jwks())
+                with self.assertRaises(RuntimeError):
+                    verify_decode_jwt(keys.mint(['get:persons']))
+
+                configure(issuer='https://anyone/')
+                with self.assertRaises(RuntimeError):
+                    verify_decode_jwt(keys.mint(['get:persons']))
+        finally:
+            auth.auth._settings.clear()
+            auth.auth._settings.update(saved)
+
+
+# Make tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -1,25 +1,43 @@
 import unittest
 import json
+import os
+import tempfile
 
+from flask import g
 from flask_sqlalchemy import SQLAlchemy
 
+from auth.testing import use_local_keys, BOSS_PERMISSIONS, \
+    EMPLOYEE_PERMISSIONS
 from okr import create_app
-from models import setup_db, Person, Objective, Requirement
+from okr.bulk_load import BulkLoader, read_records
+from okr.profiling import profile_requested
+from okr.cache import ClientBackend
+from okr.synthetic import generate_records
+from okr.queries import QueryRegression
+from okr.testing import assert_max_queries, assert_no_repeated_queries
+from sqlalchemy import create_engine, exc
+
+from models import setup_db, db, unit_of_work, engine_options, \
+    replica_engine_options, TimedQueuePool, Person, Objective, Requirement
 
 # Bearer Tokens for RBAC
 # Without Token no endpoint can be accessed!
 
 """Get bearer tokens from file"""
 
-# Boss can do everything
-with open('boss_jwt.txt', 'r') as file:
-    AUTHORIZATION_BOSS = file.read().replace('\n', '')
-
-# print(AUTHORIZATION_BOSS)
+if os.path.exists('boss_jwt.txt') and os.path.exists('employee_jwt.txt'):
+    # Boss can do everything
+    with open('boss_jwt.txt', 'r') as file:
+        AUTHORIZATION_BOSS = file.read().replace('\n', '')
 
-# employee can get everything and patch requirement
-with open('employee_jwt.txt', 'r') as file:
-    AUTHORIZATION_EMPLOYEE = file.read().replace('\n', '')
+    # employee can get everything and patch requirement
+    with open('employee_jwt.txt', 'r') as file:
+        AUTHORIZATION_EMPLOYEE = file.read().replace('\n', '')
+else:
+    # Without Auth0 tokens run offline against a local key pair
+    LOCAL_KEYS = use_local_keys()
+    AUTHORIZATION_BOSS = LOCAL_KEYS.mint(BOSS_PERMISSIONS)
+    AUTHORIZATION_EMPLOYEE = LOCAL_KEYS.mint(EMPLOYEE_PERMISSIONS)
 
 # Format tokens into headers
 HEADER_BOSS = headers = {
@@ -31,6 +49,19 @@ HEADER_EMPLOYEE = headers = {
         }
 
 
+class FakeSharedClient:
+    """Local stand-in for a redis client used as shared cache backend"""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value
+
+
 """ Start of Test Class """
 
 
@@ -80,6 +111,54 @@ class OKRTestCase(unittest.TestCase):
         self.assertEqual(data['success'], False)
         self.assertEqual(data['message'], 'resource not found')
 
+    def test_get_persons_per_page_with_total(self):
+        res = self.client.get('/persons?per_page=2&include_total=true',
+                              headers=HEADER_BOSS)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(len(data['persons']), 2)
+        self.assertEqual(data['page'], 1)
+        self.assertEqual(data['per_page'], 2)
+        self.assertEqual(data['total'], Person.query.count())
+
+    def test_get_persons_per_page_capped(self):
+        res = self.client.get('/persons?per_page=100000',
+                              headers=HEADER_BOSS)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['per_page'],
+                         self.app.config['MAX_ITEMS_PER_PAGE'])
+
+    def test_get_objectives_by_cursor(self):
+        res = self.client.get('/objectives?cursor=&per_page=2',
+                              headers=HEADER_BOSS)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(len(data['objectives']), 2)
+        self.assertTrue(data['next_cursor'])
+
+        res = self.client.get('/objectives?per_page=2&cursor={}'.format(
+            data['next_cursor']), headers=HEADER_BOSS)
+        next_data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertGreater(next_data['objectives'][0]['id'],
+                           data['objectives'][-1]['id'])
+
+    def test_400_objectives_invalid_cursor(self):
+        res = self.client.get('/objectives?cursor=not-a-cursor',
+                              headers=HEADER_BOSS)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['message'], 'bad request')
+
     def test_get_paginated_objectives(self):
         res = self.client.get('/objectives', headers=HEADER_BOSS)
         data = json.loads(res.data)
@@ -88,6 +167,14 @@ class OKRTestCase(unittest.TestCase):
         self.assertEqual(data['success'], True)
         self.assertTrue(len(data['objectives']))
 
+    def test_get_objectives_without_n_plus_one(self):
+        # the data version lookup and the page itself
+        with assert_max_queries(db.engine, 2):
+            res = self.client.get('/objectives?per_page=50',
+                                  headers=HEADER_BOSS)
+
+        self.assertEqual(res.status_code, 200)
+
     def test_404_objectives_beyond_valid_page(self):
         res = self.client.get('/objectives?page=100', headers=HEADER_BOSS)
         data = json.loads(res.data)
@@ -105,6 +192,14 @@ class OKRTestCase(unittest.TestCase):
         self.assertEqual(data['success'], True)
         self.assertTrue(len(data['requirements']))
 
+    def test_get_requirements_without_n_plus_one(self):
+        # the objective's version lookup and the requirements
+        with assert_max_queries(db.engine, 2):
+            res = self.client.get('/objectives/1/requirements',
+                                  headers=HEADER_BOSS)
+
+        self.assertEqual(res.status_code, 200)
+
     def test_404_beyond_objective(self):
         res = self.client.get('/objectives/1000/requirements',
                               headers=HEADER_BOSS)
@@ -114,6 +209,549 @@ class OKRTestCase(unittest.TestCase):
         self.assertEqual(data['success'], False)
         self.assertEqual(data['message'], 'resource not found')
 
+    # response cache
+
+    def test_get_requirements_etag_not_modified(self):
+        res = self.client.get('/objectives/1/requirements',
+                              headers=HEADER_BOSS)
+        etag = res.headers['ETag']
+
+        # only the objective's version is looked up
+        with assert_max_queries(db.engine, 1):
+            res = self.client.get('/objectives/1/requirements',
+                                  headers=dict(HEADER_BOSS,
+                                               **{'If-None-Match': etag}))
+
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.data, b'')
+
+    def test_get_requirements_cache_invalidated_by_patch(self):
+        res = self.client.get('/objectives/4/requirements',
+                              headers=HEADER_BOSS)
+        requirement = json.loads(res.data)['requirements'][0]
+
+        self.client.patch('requirements/{}'.format(requirement['id']),
+                          json={'objective_id': 4,
+                                'requirement_id': requirement['id'],
+                                'is_met': not requirement['is_met']},
+                          headers=HEADER_BOSS)
+
+        res = self.client.get('/objectives/4/requirements',
+                              headers=HEADER_BOSS)
+        updated = json.loads(res.data)['requirements'][0]
+
+        self.assertEqual(updated['is_met'], not requirement['is_met'])
+
+    def test_data_version_bumped_by_write(self):
+        res = self.client.get('/objectives?per_page=1', headers=HEADER_BOSS)
+        version = res.headers['X-Data-Version']
+
+        self.client.post('/objectives/1/requirements',
+                         json={'description': 'Bump the version'},
+                         headers=HEADER_BOSS)
+        res_after = self.client.get('/objectives?per_page=1',
+                                    headers=HEADER_BOSS)
+
+        def parse(header):
+            return dict((name, int(value)) for name, value in
+                        (part.split('=') for part in header.split(', ')))
+
+        self.assertEqual(sorted(parse(version)), ['objectives', 'persons'])
+        self.assertGreater(
+            parse(res_after.headers['X-Data-Version'])['objectives'],
+            parse(version)['objectives'])
+
+    def test_objectives_cache_sees_renamed_person(self):
+        self.client.get('/objectives?per_page=100', headers=HEADER_BOSS)
+        person = Person.query.get(1)
+        old_name = person.name
+        person.name = 'Renamed'
+        person.update()
+
+        res = self.client.get('/objectives?per_page=100',
+                              headers=HEADER_BOSS)
+        names = [objective['complete_name'] for objective in
+                 json.loads(res.data)['objectives']
+                 if objective['person'] == 1]
+
+        person = Person.query.get(1)
+        person.name = old_name
+        person.update()
+        self.assertTrue(names)
+        self.assertTrue(all(name.startswith('Renamed, ')
+                            for name in names))
+
+    def test_requirements_cache_sees_edited_objective(self):
+        objective = Objective('Objective to edit', 1)
+        objective.insert_with_requirements(['Edit it'])
+        path = '/objectives/{}/requirements'.format(objective.id)
+        self.client.get(path, headers=HEADER_BOSS)
+
+        # the request ended the session, load the objective again
+        objective = Objective.query.get(objective.id)
+        objective.description = 'Edited objective'
+        objective.update()
+
+        res = self.client.get(path, headers=HEADER_BOSS)
+        descriptions = {requirement['objective_description'] for requirement
+                        in json.loads(res.data)['requirements']}
+
+        Objective.delete_by_id(objective.id)
+        self.assertEqual(descriptions, {'Edited objective'})
+
+    def test_requirements_cache_sees_edited_requirement(self):
+        objective = Objective('Objective with edited requirement', 1)
+        requirement_id = objective.insert_with_requirements(['Edit me'])[0]
+        objective_id = objective.id
+        path = '/objectives/{}/requirements'.format(objective_id)
+        self.client.get(path, headers=HEADER_BOSS)
+
+        requirement = Requirement.query.get(requirement_id)
+        requirement.description = 'Edited requirement'
+        requirement.update()
+
+        res = self.client.get(path, headers=HEADER_BOSS)
+        descriptions = [requirement['description'] for requirement
+                        in json.loads(res.data)['requirements']]
+
+        Objective.delete_by_id(objective_id)
+        self.assertEqual(descriptions, ['Edited requirement'])
+
+    def test_writes_lock_objectives_before_data_versions(self):
+        requirement = Requirement('Lock order', 1)
+        requirement.insert()
+        requirement_id = requirement.id
+
+        with self.app.app_context():
+            engine = db.engine
+        with assert_max_queries(engine, 10) as counter:
+            self.client.delete('/requirements/{}'.format(requirement_id),
+                               headers=HEADER_BOSS)
+        updates = [statement.split()[1] for statement in counter.statements
+                   if statement.startswith('UPDATE')]
+
+        self.assertEqual(updates, ['objectives', 'data_versions'])
+
+    def test_requirement_writes_lock_objectives_first(self):
+        requirement = Requirement('Lock order', 1)
+        requirement.insert()
+        requirement_id = requirement.id
+
+        with self.app.app_context():
+            engine = db.engine
+        with assert_max_queries(engine, 10) as patched:
+            self.client.patch('/requirements/{}'.format(requirement_id),
+                              json={'requirement_id': requirement_id,
+                                    'objective_id': 1, 'is_met': True},
+                              headers=HEADER_BOSS)
+        with assert_max_queries(engine, 10) as deleted:
+            self.client.delete('/requirements/{}'.format(requirement_id),
+                               headers=HEADER_BOSS)
+
+        # same order as DELETE /objectives/<id> and its cascade
+        for counter, write in ((patched, 'UPDATE requirements'),
+                               (deleted, 'DELETE FROM requirements')):
+            statements = [
+                'lock' if statement.split()[:4] == [
+                    'SELECT', 'objectives.id', 'FROM', 'objectives']
+                else 'write' for statement in counter.statements
+                if statement.startswith(write) or
+                statement.startswith('SELECT objectives.id')]
+            self.assertEqual(statements, ['lock', 'write'])
+
+    def test_in_process_caches_see_writes_of_other_workers(self):
+        other_worker = create_app().test_client()
+        res = self.client.get('/objectives/4/requirements',
+                              headers=HEADER_BOSS)
+        requirement = json.loads(res.data)['requirements'][0]
+
+        other_worker.patch('requirements/{}'.format(requirement['id']),
+                           json={'objective_id': 4,
+                                 'requirement_id': requirement['id'],
+                                 'is_met': not requirement['is_met']},
+                           headers=HEADER_BOSS)
+
+        res = self.client.get('/objectives/4/requirements',
+                              headers=HEADER_BOSS)
+        updated = json.loads(res.data)['requirements'][0]
+
+        self.assertEqual(updated['is_met'], not requirement['is_met'])
+
+    def test_shared_cache_backend(self):
+        shared = FakeSharedClient()
+        workers = [create_app({'RESPONSE_CACHE_BACKEND':
+                               ClientBackend(shared)}).test_client()
+                   for _ in range(2)]
+
+        res = workers[0].get('/persons', headers=HEADER_BOSS)
+        self.assertEqual(res.status_code, 200)
+
+        with assert_max_queries(db.engine, 1):
+            cached = workers[1].get('/persons', headers=HEADER_BOSS)
+
+        self.assertEqual(cached.data, res.data)
+        self.assertEqual(cached.headers['ETag'], res.headers['ETag'])
+
+    # reports
+
+    def test_get_progress_report(self):
+        with assert_max_queries(db.engine, 1):
+            res = self.client.get('/reports/progress', headers=HEADER_BOSS)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        report = data['report']
+        self.assertEqual(report['requirements_total'],
+                         sum(person['requirements_total']
+                             for person in report['persons']))
+        self.assertEqual(len(report['persons']), Person.query.count())
+
+    def test_get_progress_report_bosses(self):
+        res = self.client.get('/reports/progress?is_boss=true',
+                              headers=HEADER_BOSS)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(all(person['is_boss']
+                            for person in data['report']['persons']))
+
+    def test_404_progress_report_unknown_person(self):
+        res = self.client.get('/reports/progress?person=1000',
+                              headers=HEADER_BOSS)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data['success'], False)
+
+    def test_progress_report_no_permission(self):
+        res = self.client.get('/reports/progress', headers=HEADER_EMPLOYEE)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 401)
+        self.assertEqual(data['message'],
+                         'User does not have these permissions.')
+
+    # export
+
+    def test_export_ndjson(self):
+        res = self.client.get('/export', headers=HEADER_BOSS)
+        records = [json.loads(line)
+                   for line in res.data.decode('utf-8').splitlines()]
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.mimetype, 'application/x-ndjson')
+        self.assertEqual(len([record for record in records
+                              if record['type'] == 'person']),
+                         Person.query.count())
+        self.assertEqual(len([record for record in records
+                              if record['type'] == 'requirement']),
+                         Requirement.query.count())
+
+    def test_export_csv(self):
+        res = self.client.get('/export?format=csv', headers=HEADER_BOSS)
+        lines = res.data.decode('utf-8').splitlines()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.mimetype, 'text/csv')
+        self.assertTrue(lines[0].startswith('type,id,'))
+        self.assertEqual(len(lines) - 1, Person.query.count() +
+                         Objective.query.count() + Requirement.query.count())
+
+    def test_export_no_permission(self):
+        res = self.client.get('/export', headers=HEADER_EMPLOYEE)
+
+        self.assertEqual(res.status_code, 401)
+
+    # metrics
+
+    def test_server_timing_header(self):
+        res = self.client.get('/objectives/1/requirements',
+                              headers=HEADER_BOSS)
+        phases = [part.split(';')[0] for part in
+                  res.headers['Server-Timing'].split(', ')]
+
+        self.assertEqual(phases, ['auth', 'db', 'serialization', 'total'])
+
+    def test_metrics_per_route_and_status(self):
+        self.client.get('/persons', headers=HEADER_BOSS)
+        self.client.get('/persons?page=100', headers=HEADER_BOSS)
+        res = self.client.get('/metrics', headers=HEADER_BOSS)
+        text = res.data.decode('utf-8')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('okr_request_duration_seconds_count{route="/persons",'
+                      'method="GET",status="200",phase="db"} 1', text)
+        self.assertIn('okr_request_duration_seconds_count{route="/persons",'
+                      'method="GET",status="404",phase="auth"} 1', text)
+        self.assertIn('okr_request_queries_bucket{route="/persons",'
+                      'method="GET",status="200",le="+Inf"} 1', text)
+
+    def test_metrics_no_permission(self):
+        res = self.client.get('/metrics', headers=HEADER_EMPLOYEE)
+
+        self.assertEqual(res.status_code, 401)
+
+    # connection pool
+
+    def test_engine_options_from_environment(self):
+        options = engine_options(
+            'postgresql://localhost:5432/okr',
+            {'DB_POOL_SIZE': '20', 'DB_POOL_PRE_PING': 'false',
+             'DB_STATEMENT_TIMEOUT': '5000'})
+
+        self.assertEqual(options['poolclass'], TimedQueuePool)
+        self.assertEqual(options['pool_size'], 20)
+        self.assertEqual(options['max_overflow'], 10)
+        self.assertFalse(options['pool_pre_ping'])
+        self.assertEqual(options['connect_args'],
+                         {'options': '-c statement_timeout=5000'})
+        self.assertEqual(engine_options('sqlite:///okr.db', {}), {})
+
+    def test_replica_engine_options_have_connect_timeout(self):
+        options = replica_engine_options(
+            'postgresql://replica:5432/okr', {'DB_STATEMENT_TIMEOUT': '5000'})
+
+        self.assertEqual(options['poolclass'], TimedQueuePool)
+        self.assertEqual(options['connect_args'],
+                         {'options': '-c statement_timeout=5000',
+                          'connect_timeout': 2})
+        self.assertEqual(replica_engine_options(
+            'postgresql://replica:5432/okr',
+            {'DB_REPLICA_CONNECT_TIMEOUT': '5'})['connect_args'],
+            {'connect_timeout': 5})
+        self.assertEqual(replica_engine_options('sqlite:///okr.db', {}), {})
+
+    def test_pool_counts_waits_and_timeouts(self):
+        with tempfile.TemporaryDirectory() as directory:
+            engine = create_engine(
+                'sqlite:///' + os.path.join(directory, 'pool.db'),
+                poolclass=TimedQueuePool, pool_size=1, max_overflow=0,
+                pool_timeout=0.05)
+            connection = engine.connect()
+
+            self.assertEqual(engine.pool.checkedout(), 1)
+            with self.assertRaises(exc.TimeoutError):
+                engine.connect()
+            self.assertEqual(engine.pool.timeouts, 1)
+            self.assertGreaterEqual(engine.pool.wait_seconds, 0.05)
+
+            connection.close()
+            engine.dispose()
+
+    def test_metrics_show_pool_usage(self):
+        app = create_app({'SQLALCHEMY_ENGINE_OPTIONS': {
+            'poolclass': TimedQueuePool, 'pool_size': 2}})
+        res = app.test_client().get('/metrics', headers=HEADER_BOSS)
+        text = res.data.decode('utf-8')
+
+        self.assertIn('okr_db_pool_size 2', text)
+        self.assertIn('okr_db_pool_checked_out ', text)
+        self.assertIn('okr_db_pool_wait_seconds_total ', text)
+
+    # read replicas
+
+    def make_replica(self, directory):
+        path = 'sqlite:///' + os.path.join(directory, 'replica.db')
+        engine = create_engine(path)
+        db.Model.metadata.create_all(engine)
+        engine.execute(Person.__table__.insert(), name='Replica',
+                       first_name='Only', is_boss=False)
+        engine.dispose()
+        return path
+
+    def test_reads_go_to_replica(self):
+        with tempfile.TemporaryDirectory() as directory:
+            app = create_app({
+                'SQLALCHEMY_REPLICA_URIS': [self.make_replica(directory)]})
+            client = app.test_client()
+
+            res = client.get('/persons', headers=HEADER_BOSS)
+            names = [person['name'] for person in
+                     json.loads(res.data)['persons']]
+            self.assertEqual(names, ['Replica'])
+
+            headers = dict(HEADER_BOSS, **{'X-Consistency': 'strong'})
+            res = client.get('/persons', headers=headers)
+            names = [person['name'] for person in
+                     json.loads(res.data)['persons']]
+            self.assertNotIn('Replica', names)
+
+            app.extensions['replicas'].dispose()
+
+    def test_writes_go_to_primary(self):
+        with tempfile.TemporaryDirectory() as directory:
+            app = create_app({
+                'SQLALCHEMY_REPLICA_URIS': [self.make_replica(directory)]})
+            res = app.test_client().post('/objectives', json={
+                'objective': 'Written to the primary', 'person': 1,
+                'requirements': ['One']}, headers=HEADER_BOSS)
+            objective_id = json.loads(res.data)['objective_id']
+
+            self.assertEqual(res.status_code, 200)
+            self.assertIsNotNone(Objective.query.get(objective_id))
+
+            app.extensions['replicas'].dispose()
+
+    def test_flush_ignores_replica(self):
+        with tempfile.TemporaryDirectory() as directory:
+            replica = create_engine(self.make_replica(directory))
+            with self.app.test_request_context():
+                g.db_replica = replica
+                person = Person('Primary', 'Written', False)
+                person.insert()
+                self.assertIsNone(Person.query.filter(
+                    Person.name == 'Primary').first())
+
+                g.db_replica = None
+                self.assertIsNotNone(Person.query.filter(
+                    Person.name == 'Primary').first())
+                person.delete()
+            replica.dispose()
+
+    def test_replica_down_falls_back_to_primary(self):
+        app = create_app({'SQLALCHEMY_REPLICA_URIS': [
+            'sqlite:////nonexistent/replica.db']})
+        with self.assertLogs('okr.models', 'WARNING'):
+            res = app.test_client().get('/persons', headers=HEADER_BOSS)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(len(json.loads(res.data)['persons']))
+
+    # N+1 detection
+
+    def test_list_endpoints_do_not_repeat_queries(self):
+        with self.app.app_context():
+            engine = db.engine
+        with assert_no_repeated_queries(engine):
+            self.client.get('/objectives?per_page=20', headers=HEADER_BOSS)
+        with assert_no_repeated_queries(engine):
+            self.client.get('/objectives/1/requirements',
+                            headers=HEADER_BOSS)
+
+    def test_query_detector_flags_lazy_loads(self):
+        app = create_app({'QUERY_DETECTOR': True, 'QUERY_REPEAT_LIMIT': 1,
+                          'QUERY_DETECTOR_STRICT': True, 'TESTING': True})
+
+        @app.route('/lazy')
+        def lazy_persons():
+            objectives = Objective.query.order_by(Objective.id).all()
+            return ', '.join(objective.person_ref.name
+                             for objective in objectives)
+
+        client = app.test_client()
+        with self.assertRaises(QueryRegression):
+            client.get('/lazy')
+        self.assertEqual(
+            client.get('/objectives', headers=HEADER_BOSS).status_code, 200)
+
+    def test_query_detector_logs_slow_queries(self):
+        app = create_app({'QUERY_DETECTOR': True, 'SLOW_QUERY_SECONDS': 0})
+        client = app.test_client()
+
+        with self.assertLogs('okr.queries', 'WARNING') as logs:
+            client.get('/persons', headers=HEADER_BOSS)
+        self.assertIn('slow query', logs.output[0])
+
+    # profiling
+
+    def test_profile_on_request_header(self):
+        with tempfile.TemporaryDirectory() as directory:
+            app = create_app({'PROFILE_DIR': directory, 'PROFILE_KEEP': 2})
+            client = app.test_client()
+            headers = dict(HEADER_BOSS, **{'X-Profile': '1'})
+
+            names = [client.get('/persons', headers=headers).headers[
+                'X-Profile-File'] for _ in range(3)]
+
+            self.assertEqual(sorted(os.listdir(directory)),
+                             sorted(names[1:]))
+
+    def test_profile_header_needs_permission(self):
+        with tempfile.TemporaryDirectory() as directory:
+            app = create_app({'PROFILE_DIR': directory})
+            headers = dict(HEADER_EMPLOYEE, **{'X-Profile': '1'})
+            res = app.test_client().get('/persons', headers=headers)
+
+            self.assertEqual(res.status_code, 200)
+            self.assertNotIn('X-Profile-File', res.headers)
+            self.assertEqual(os.listdir(directory), [])
+
+    def test_profile_sampled_requests(self):
+        with tempfile.TemporaryDirectory() as directory:
+            app = create_app({'PROFILE_DIR': directory,
+                              'PROFILE_SAMPLE_RATE': 1.0})
+            res = app.test_client().get('/persons', headers=HEADER_EMPLOYEE)
+
+            self.assertNotIn('X-Profile-File', res.headers)
+            self.assertEqual(len(os.listdir(directory)), 1)
+
+    def test_profile_check_is_not_timed_as_auth(self):
+        headers = dict(HEADER_BOSS, **{'X-Profile': '1'})
+        with self.app.test_request_context('/persons', headers=headers):
+            self.assertTrue(profile_requested())
+            self.assertNotIn('auth_seconds', g)
+
+    def test_unwritable_profile_is_logged(self):
+        with tempfile.TemporaryDirectory() as directory:
+            # a file where the profile directory should be
+            path = os.path.join(directory, 'profiles')
+            open(path, 'w').close()
+            app = create_app({'PROFILE_DIR': path,
+                              'PROFILE_SAMPLE_RATE': 1.0})
+
+            with self.assertLogs('okr.profiling', 'ERROR'):
+                res = app.test_client().get('/persons',
+                                            headers=HEADER_EMPLOYEE)
+            self.assertEqual(res.status_code, 200)
+
+    def test_profile_keep_must_be_positive(self):
+        with self.assertRaises(ValueError):
+            create_app({'PROFILE_KEEP': 0})
+
+    # bulk load
+
+    def test_bulk_load_remaps_ids(self):
+        records = [
+            {'type': 'requirement', 'id': 1, 'description': 'Loaded first',
+             'is_met': True, 'objective': 1},
+            {'type': 'person', 'id': 1, 'name': 'Load', 'first_name': 'Bulk',
+             'is_boss': False},
+            {'type': 'objective', 'id': 1, 'description': 'Be imported',
+             'person': 1},
+            {'type': 'requirement', 'id': 2, 'description': 'Loaded second',
+             'is_met': False, 'objective': 1},
+        ]
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson',
+                                         delete=False) as file:
+            file.writelines(json.dumps(record) + '\n' for record in records)
+
+        with self.app.app_context():
+            counts = BulkLoader().load(read_records(file.name))
+        os.remove(file.name)
+
+        person = Person.query.filter(Person.name == 'Load').one()
+        objective = Objective.query.filter(
+            Objective.person == person.id).one()
+
+        self.assertEqual(counts, {'person': 1, 'objective': 1,
+                                  'requirement': 2})
+        self.assertEqual(objective.requirements_total, 2)
+        self.assertEqual(objective.requirements_met, 1)
+        self.assertEqual(Requirement.query.filter(
+            Requirement.objective == objective.id).count(), 2)
+        person.delete()
+
+    def test_synthetic_data_is_deterministic(self):
+        first = list(generate_records(20, seed=7))
+        second = list(generate_records(20, seed=7))
+        other = list(generate_records(20, seed=8))
+
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other)
+        self.assertEqual(len([record for record in first
+                              if record['type'] == 'person']), 20)
+
     # delete
     # no one can delete persons
 
@@ -128,6 +766,45 @@ class OKRTestCase(unittest.TestCase):
         self.assertEqual(data['success'], True)
         self.assertEqual(data['deleted_id'], 2)
 
+    def test_delete_objective_cascades_in_database(self):
+        objective = Objective('Delete me', 1)
+        requirement_ids = objective.insert_with_requirements(
+            ['First', 'Second', 'Third'])
+        objective_id = objective.id
+        db.session.remove()
+
+        # the delete and the table versions
+        with assert_max_queries(db.engine, 2):
+            res = self.client.delete('/objectives/{}'.format(objective_id),
+                                     headers=HEADER_BOSS)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(Requirement.query.filter(
+            Requirement.id.in_(requirement_ids)).count(), 0)
+
+    def test_progress_counters(self):
+        objective = Objective('Count my progress', 1)
+        requirement_ids = objective.insert_with_requirements(
+            ['First', 'Second', 'Third'])
+        objective_id = objective.id
+
+        self.client.patch('requirements/{}'.format(requirement_ids[0]),
+                          json={'objective_id': objective_id,
+                                'requirement_id': requirement_ids[0],
+                                'is_met': True},
+                          headers=HEADER_BOSS)
+        self.client.delete('/requirements/{}'.format(requirement_ids[1]),
+                           headers=HEADER_BOSS)
+        self.client.post('/objectives/{}/requirements'.format(objective_id),
+                         json={'description': 'Fourth'},
+                         headers=HEADER_BOSS)
+
+        db.session.remove()
+        objective = Objective.query.get(objective_id)
+        self.assertEqual(objective.format()['requirements_total'], 3)
+        self.assertEqual(objective.format()['requirements_met'], 1)
+        objective.delete()
+
     def test_delete_objective_fail(self):
         res = self.client.delete('/objectives/1000', headers=HEADER_BOSS)
         data = json.loads(res.data)
@@ -186,6 +863,36 @@ class OKRTestCase(unittest.TestCase):
         self.assertEqual(data['is_met'], False)
         self.assertEqual(data['changed'], False)
 
+    def test_patch_requirement_single_statement(self):
+        update_data = {
+            'objective_id': 3,
+            'requirement_id': 8,
+            'is_met': True
+        }
+        # the objective's row lock, the status change, its progress
+        # counter and the table versions
+        with assert_max_queries(db.engine, 4):
+            res = self.client.patch('requirements/8', json=update_data,
+                                    headers=HEADER_EMPLOYEE)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['previous_status'], False)
+        self.assertEqual(data['changed'], True)
+
+    def test_patch_requirement_wrong_objective(self):
+        update_data = {
+            'objective_id': 4,
+            'requirement_id': 1,
+            'is_met': True
+        }
+        res = self.client.patch('requirements/1', json=update_data,
+                                headers=HEADER_BOSS)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data['success'], False)
+
     def test_patch_requirement_malformed(self):
         update_data = {
             'random': 1,
@@ -243,6 +950,47 @@ class OKRTestCase(unittest.TestCase):
         self.assertEqual(len(all_requirements_post) -
                          len(all_requirements_pre), 0)
 
+    def test_post_new_requirements_batch(self):
+        new_requirements = [
+            {'description': 'Write the batch endpoint'},
+            {'description': 'Test the batch endpoint'}
+        ]
+
+        res = self.client.post('/objectives/1/requirements',
+                               json=new_requirements, headers=HEADER_BOSS)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['n_requirements'], 2)
+        created = [Requirement.query.get(requirement_id).description
+                   for requirement_id in data['new_requirement_ids']]
+        self.assertEqual(created, ['Write the batch endpoint',
+                                   'Test the batch endpoint'])
+
+    def test_post_new_requirements_batch_malformed(self):
+        new_requirements = [
+            {'description': 'Valid requirement'},
+            {'descr': 'Typo'},
+            'not an object'
+        ]
+
+        all_requirements_pre = Requirement.query.filter(
+            Requirement.objective == 1).count()
+
+        res = self.client.post('/objectives/1/requirements',
+                               json=new_requirements, headers=HEADER_BOSS)
+        data = json.loads(res.data)
+
+        all_requirements_post = Requirement.query.filter(
+            Requirement.objective == 1).count()
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data['success'], False)
+        self.assertEqual([error['index'] for error in data['errors']],
+                         [1, 2])
+        self.assertEqual(all_requirements_post, all_requirements_pre)
+
     def test_post_new_objective_single_successful(self):
         new_objective = {
             'person': 1,
@@ -263,6 +1011,44 @@ class OKRTestCase(unittest.TestCase):
         self.assertEqual(len(all_objectives_post) -
                          len(all_objectives_pre), 1)
 
+    def test_post_new_objective_with_requirements(self):
+        new_objective = {
+            'person': 2,
+            'objective': 'Ship the quarterly report',
+            'requirements': ['Collect numbers',
+                             {'description': 'Write summary'},
+                             'Present to the board']
+        }
+
+        res = self.client.post('/objectives', json=new_objective,
+                               headers=HEADER_BOSS)
+        data = json.loads(res.data)
+
+        requirements = Requirement.query.filter(
+            Requirement.objective == data['objective_id']).all()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['n_requirements'], 3)
+        self.assertEqual(len(requirements), 3)
+
+    def test_post_new_objective_invalid_requirement(self):
+        new_objective = {
+            'person': 2,
+            'objective': 'Never created',
+            'requirements': ['Valid', {'descr': 'Typo'}]
+        }
+
+        all_objectives_pre = Objective.query.count()
+
+        res = self.client.post('/objectives', json=new_objective,
+                               headers=HEADER_BOSS)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data['errors'][0]['index'], 1)
+        self.assertEqual(Objective.query.count(), all_objectives_pre)
+
     def test_post_new_objective_fail(self):
         new_objective = {
             'objective_typo': 'Do better test driven development',
@@ -283,6 +1069,30 @@ class OKRTestCase(unittest.TestCase):
         self.assertEqual(len(all_objectives_post) -
                          len(all_objectives_pre), 0)
 
+    # unit of work
+
+    def test_unit_of_work_commits_once(self):
+        with unit_of_work():
+            person = Person('Doe', 'Jane')
+            person.insert()
+            objective = Objective('Share one commit', person.id)
+            objective.insert()
+            person_id, objective_id = person.id, objective.id
+
+        db.session.remove()
+        self.assertIsNotNone(Objective.query.get(objective_id))
+        Person.query.get(person_id).delete()
+
+    def test_unit_of_work_rolls_back(self):
+        persons_pre = Person.query.count()
+
+        with self.assertRaises(RuntimeError):
+            with unit_of_work():
+                Person('Doe', 'John').insert()
+                raise RuntimeError('abort the unit of work')
+
+        self.assertEqual(Person.query.count(), persons_pre)
+
     """
     One test for success behavior of each endpoint
     One test for error behavior of each endpoint